@@ -40,6 +40,8 @@ a = Analysis(
         "torchvision",
         "cv2",
         "numpy",
+        "scipy",
+        "scipy.optimize",
         "PIL",
         "yolov5",
         "yolov5.models",
@@ -47,6 +49,10 @@ a = Analysis(
         "yolov5.utils.general",
         "yolov5.utils.torch_utils",
         "yolov5.models.common",
+        "yolov5.export",
+        "onnx",
+        "onnxruntime",
+        "openvino",
     ],
     noarchive=False,
 )
@@ -0,0 +1,89 @@
+import os
+from pathlib import Path
+
+import torch
+from yolov5.models.common import DetectMultiBackend
+
+# ============================================================
+# MEGADETECTOR BACKENDS
+# - "pytorch":     the pickled best.pt in eager mode
+# - "onnx":        ONNX Runtime (dynamic batch / input size)
+# - "torchscript": traced TorchScript (fixed 1 x 3 x size x size input)
+# - "openvino":    INT8 OpenVINO IR, built by quantize_openvino.py
+#                  (calibration needs our own trap images, so never automatic)
+# - exported from best.pt on first use and cached next to the weights
+#   (or in the cache folder if that is read-only); the file name carries
+#   the weight hash, so new weights are exported again
+# - loaded through yolov5's DetectMultiBackend; the caller wraps it in
+#   AutoShape, so NMS settings and post-processing do not change
+# ============================================================
+BACKENDS = ("pytorch", "onnx", "torchscript", "openvino")
+SUFFIXES = {"onnx": ".onnx", "torchscript": ".torchscript", "openvino": "_int8_openvino_model"}  # OpenVINO: a folder
+ONNX_OPSET = 17
+
+
+def artifact_name(weights: Path, weights_hash: str, backend: str) -> str:
+    return f"{weights.stem}_{weights_hash[:16]}{SUFFIXES[backend]}"
+
+
+def find_artifact(weights: Path, weights_hash: str, backend: str, cache_dir):
+    """(path, exists): an earlier export if there is one, else where a new export should go"""
+    name = artifact_name(weights, weights_hash, backend)
+    folders = [weights.parent, Path(cache_dir)]
+    for folder in folders:
+        if (folder / name).exists():
+            return folder / name, True
+    if os.access(weights.parent, os.W_OK):
+        return weights.parent / name, False
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    return Path(cache_dir) / name, False
+
+
+def export_model(model, backend: str, path: Path, image_size: int):
+    """model: eager yolov5 DetectionModel (moved to CPU by the ONNX export)"""
+    from yolov5.export import export_onnx, export_torchscript  # heavy imports, only needed once
+
+    for m in model.modules():
+        if type(m).__name__ == "Detect":
+            m.inplace = False
+            m.dynamic = backend == "onnx"  # grids follow the input size
+            m.export = True                # single output tensor
+
+    im = torch.zeros(1, 3, image_size, image_size, device=next(model.parameters()).device)
+    with torch.no_grad():
+        model(im)  # dry run builds the grids
+    if backend == "onnx":
+        exported, _ = export_onnx(model, im, path, ONNX_OPSET, True, False)
+    else:
+        exported, _ = export_torchscript(model, im, path, False)
+    if exported is None:
+        raise RuntimeError(f"MegaDetector {backend} export failed")
+    return Path(exported)
+
+
+def ensure_export(backend: str, weights: Path, weights_hash: str, load_eager, cache_dir, image_size: int) -> Path:
+    """
+    path of the cached export; ONNX / TorchScript are exported first if needed
+    load_eager: returns the eager model, only called when an export is needed
+    """
+    path, exists = find_artifact(weights, weights_hash, backend, cache_dir)
+    if exists:
+        return path
+    if backend == "openvino":
+        raise RuntimeError(f"no INT8 OpenVINO model at {path}, build it with quantize_openvino.py")
+    print(f"[INFO] Exporting MegaDetector to {backend}: {path}")
+    return export_model(load_eager(), backend, path, image_size)
+
+
+def load_backend(backend: str, weights: Path, weights_hash: str, load_eager, device, cache_dir, image_size: int):
+    """returns a DetectMultiBackend with `fixed_shape` / `max_batch` set for the caller"""
+    if backend not in SUFFIXES:
+        raise ValueError(f"unknown MegaDetector backend {backend!r}, expected one of {BACKENDS}")
+
+    path = ensure_export(backend, weights, weights_hash, load_eager, cache_dir, image_size)
+
+    model = DetectMultiBackend(str(path), device=torch.device(device), fuse=False)
+    static = backend == "torchscript"
+    model.fixed_shape = (image_size, image_size) if static else None
+    model.max_batch = 1 if static else None
+    return model
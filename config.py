@@ -26,3 +26,104 @@ BEST_MODEL_EXCLUDE_CLASSES = {"person"}
 
 IMAGE_EXT = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
 VIDEO_EXT = {".mp4", ".avi", ".mov", ".mkv", ".wmv"}
+
+# Detections smaller than this (px, either side) are ignored
+MIN_BOX_SIZE = 40
+
+# SpeciesNet labels/scores kept per crop
+SPECIES_TOP_K = 5
+SPECIES_BATCH_SIZE = 32  # max crops per SpeciesNet forward pass (480x480 each; lower on small GPUs)
+
+# Batched image inference
+IMAGE_BATCH_SIZE = 8  # images per MegaDetector forward pass
+ASPECT_BUCKET_PRECISION = 1  # decimals of w/h ratio used to bucket images in a batch
+MD_INPUT_SIZE = 640  # MegaDetector input size (longest side)
+MD_BACKEND = "pytorch"  # "pytorch" (eager best.pt), "onnx" (ONNX Runtime, fastest on CPU), "torchscript";
+                        # exported from best.pt on first use and cached next to it
+                        # "openvino" = INT8 OpenVINO IR for Intel CPUs, built once with quantize_openvino.py
+SPECIES_INPUT_SIZE = 480  # SpeciesNet crop input size
+
+# JPEGs are decoded at 1/2, 1/4 or 1/8 size (never below MD_INPUT_SIZE) for detection;
+# full resolution is decoded only for annotated output and small crops
+REDUCED_DECODE_ENABLED = True
+
+# Image output
+IMAGE_OUTPUT_MODE = "annotated"  # "annotated" = re-encode with boxes drawn in,
+                                 # "link" = hard-link/copy the original, boxes only in megadetector_<stamp>.json,
+                                 # "preview" = downscaled annotated copy
+IMAGE_JPEG_QUALITY = 95          # re-encoded outputs ("annotated" / "preview")
+IMAGE_PREVIEW_WIDTH = 1280       # width of "preview" outputs
+
+# Staged image pipeline (decode -> detect -> classify -> annotate -> write)
+PIPELINE_STAGE_WORKERS = {
+    "decode": 2,
+    "detect": 1,
+    "classify": 1,
+    "annotate": 1,
+    "write": 2,
+}
+PIPELINE_QUEUE_SIZE = {  # max job groups waiting in front of each stage
+    "decode": 32,      # file paths only
+    "background": 8,   # reduced-size frames from here on
+    "detect": 16,      # two detector batches
+    "classify": 16,
+    "annotate": 2,     # from here on a job may hold its full-resolution frame (36-60 MB at 12-20 MP)
+    "write": 2,
+}
+
+# Multi-process CPU sharding (opt-in mode)
+# - 1 = one process running the staged pipeline above (default)
+# - >1 = a pool of worker processes, each loading its own MegaDetector + SpeciesNet;
+#   the staged pipeline and PIPELINE_STAGE_WORKERS are not used in this mode
+# - 0 = auto: CPU-only machines use cores // CPU_THREADS_PER_WORKER, capped by free RAM
+CPU_WORKER_PROCESSES = 1
+CPU_THREADS_PER_WORKER = 4  # torch intra-op threads per worker when sizing the pool automatically
+CPU_WORKER_MEMORY_GB = 3.0  # RAM one worker needs (both models + image batches) when sizing the pool automatically
+
+# Content-addressed raw-detection cache, shared by all runs on this machine
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".camera_trap_cache")
+DETECTION_CACHE_ENABLED = True
+
+# Video analysis
+VIDEO_DETECTOR_INTERVAL = 10  # run MegaDetector every N frames; tracks are motion-predicted in between
+VIDEO_DETECTOR_WIDTH = 512    # frames are downscaled to this width for detection/tracking
+VIDEO_OUTPUT_MODE = "annotated"  # "annotated" = re-encode with boxes, "scan" = skip undetected frames, link/copy originals,
+                                 # "clips" = write only the segments with matching tracks
+                                 # "triage" = like "scan", stop once a match is confirmed
+TRIAGE_CONFIRM_FRAMES = 1  # detector frames with a match needed before triage stops reading a video
+CLIP_PRE_ROLL_S = 2.0   # seconds kept before the first matching frame of a clip
+CLIP_POST_ROLL_S = 3.0  # seconds kept after the last matching frame of a clip
+VIDEO_WRITER_QUEUE_SIZE = 16  # annotated frames waiting for the encoder thread (1080p ~ 6 MB each)
+
+# Motion gate for videos (skip MegaDetector on still frames)
+MOTION_GATE_ENABLED = False
+MOTION_GATE_WIDTH = 160        # width of the grayscale copy used for the motion score
+MOTION_PIXEL_THRESHOLD = 25    # grey-level change that counts as motion (lower = more sensitive)
+MOTION_MIN_AREA = 0.002        # fraction of moving pixels needed to run the detector (lower = more sensitive)
+MOTION_WARMUP_FRAMES = 3       # analysed frames per video that always run the detector
+
+# Burst / sequence grouping (images)
+SEQUENCE_GROUPING = False      # label each trigger's burst once, from its best crops
+SEQUENCE_MAX_GAP_S = 5.0       # max seconds between two frames of one burst (EXIF DateTimeOriginal)
+SEQUENCE_MAX_IMAGES = 20       # longer runs (time-lapse, busy trap) are split
+SEQUENCE_CLASSIFY_CROPS = 3    # best crops per burst sent to SpeciesNet
+SEQUENCE_SKIP_BLANK_BURSTS = False  # opt-in: skip the rest of a burst whose first frames are blank
+                                    # (faster, but misses animals that enter late in the burst)
+SEQUENCE_PROBE_IMAGES = 2      # first frames that always run MegaDetector when skipping blank bursts
+
+# Per-camera background pre-filter (images): blanks from wind / sun skip MegaDetector
+BACKGROUND_FILTER_ENABLED = False
+BACKGROUND_WIDTH = 64              # width of the grayscale thumbnails the background is built from
+BACKGROUND_HISTORY = 9             # recent frames per camera folder in the running median
+BACKGROUND_WARMUP_FRAMES = 3       # blank frames (confirmed by MegaDetector) per camera folder before anything is rejected
+BACKGROUND_RESET_FRAMES = 3        # confirmed blank frames in a row that differ from the background: the scene changed, rebuild it
+BACKGROUND_PIXEL_THRESHOLD = 20    # grey-level change that counts as a changed pixel (higher = more rejections)
+BACKGROUND_MIN_AREA = 0.005        # images with less changed area than this are blank (higher = more rejections)
+BACKGROUND_AUDIT_EVERY = 20        # copy every Nth rejected image to the audit folder (0 = never)
+BACKGROUND_AUDIT_DIR = "_background_rejected"  # audit folder, inside each output folder
+
+# Perceptual-hash duplicate detection (copied / re-uploaded images reuse earlier results, needs the cache)
+DUPLICATE_DETECTION_ENABLED = False
+DUPLICATE_MAX_DISTANCE = 3       # dHash bits (of 256) two copies may differ by after re-encoding / resizing
+DUPLICATE_MAX_TIME_GAP_S = 1.0   # capture times of two copies must agree this closely
+                                 # (copies must also be in another folder or have the same byte size)
@@ -0,0 +1,54 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+# ============================================================
+# RAW-DETECTION CACHE (content addressed, shared by every run)
+# - key = image content hash + model weight hashes + inference settings
+# - value = every MegaDetector row (all classes) and the SpeciesNet top-k
+#   of each row that has been classified so far
+# - target classes / detection mode are applied after the cache, so
+#   changing the selection only replays filtering, drawing and saving
+# ============================================================
+CACHE_NAME = "detections.sqlite"
+
+
+class DetectionCache:
+    def __init__(self, cache_dir: Path, settings: dict):
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / CACHE_NAME
+        self._settings = json.dumps(settings, sort_keys=True, default=str)
+
+        # shared by the pipeline's stage threads; several worker processes may open it too
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS raw (key TEXT PRIMARY KEY, record TEXT NOT NULL)")
+        self._db.commit()
+
+    def key(self, content_hash: str) -> str:
+        return hashlib.sha256(f"{content_hash}|{self._settings}".encode()).hexdigest()
+
+    def get(self, key: str):
+        """Return {"rows": [[x1, y1, x2, y2, conf, cls], ...], "species": {row: top-k}} or None."""
+        with self._lock:
+            row = self._db.execute("SELECT record FROM raw WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        record["species"] = {int(k): v for k, v in record.get("species", {}).items()}
+        return record
+
+    def put(self, key: str, rows, species: dict):
+        record = json.dumps({"rows": [list(map(float, r)) for r in rows], "species": species})
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO raw VALUES (?, ?)", (key, record))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
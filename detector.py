@@ -1,4 +1,10 @@
 import os, sys
+import hashlib
+import queue
+from collections import deque
+import threading
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 
 # ---- HARD DISABLE YOLOv5 AUTO INSTALL / TORCH HUB ----
 os.environ["YOLOv5_REQUIREMENTS"] = "0"
@@ -11,19 +17,42 @@ if sys.stdout is None:
     sys.stdout = open(os.devnull, "w")
 
 import torch
+import torch.nn.functional as F
 torch.hub.load = lambda *a, **k: (_ for _ in ()).throw(RuntimeError("torch.hub disabled"))
 torch.hub._get_cache_or_reload = lambda *a, **k: None
 
 import cv2
+import numpy as np
 import warnings
 from PIL import Image
 from tqdm import tqdm
 from pathlib import Path
-import pandas as pd
 from datetime import datetime
 
 from speciesnet.classifier import SpeciesNetClassifier
 
+from config import MIN_BOX_SIZE, SPECIES_TOP_K, SPECIES_BATCH_SIZE, IMAGE_BATCH_SIZE, ASPECT_BUCKET_PRECISION, PIPELINE_STAGE_WORKERS, PIPELINE_QUEUE_SIZE
+from config import MD_INPUT_SIZE, SPECIES_INPUT_SIZE, REDUCED_DECODE_ENABLED, MD_BACKEND
+from config import IMAGE_OUTPUT_MODE, IMAGE_JPEG_QUALITY, IMAGE_PREVIEW_WIDTH
+from config import CPU_WORKER_PROCESSES, CPU_THREADS_PER_WORKER, CPU_WORKER_MEMORY_GB
+from config import CACHE_DIR, DETECTION_CACHE_ENABLED, DUPLICATE_DETECTION_ENABLED, DUPLICATE_MAX_DISTANCE, DUPLICATE_MAX_TIME_GAP_S
+from config import VIDEO_DETECTOR_INTERVAL, VIDEO_DETECTOR_WIDTH, VIDEO_OUTPUT_MODE, CLIP_PRE_ROLL_S, CLIP_POST_ROLL_S
+from config import VIDEO_WRITER_QUEUE_SIZE, TRIAGE_CONFIRM_FRAMES
+from config import MOTION_GATE_ENABLED, MOTION_GATE_WIDTH, MOTION_PIXEL_THRESHOLD, MOTION_MIN_AREA, MOTION_WARMUP_FRAMES
+from config import BACKGROUND_FILTER_ENABLED, BACKGROUND_WIDTH, BACKGROUND_HISTORY, BACKGROUND_WARMUP_FRAMES
+from config import BACKGROUND_PIXEL_THRESHOLD, BACKGROUND_MIN_AREA, BACKGROUND_AUDIT_EVERY, BACKGROUND_AUDIT_DIR, BACKGROUND_RESET_FRAMES
+from config import SEQUENCE_GROUPING, SEQUENCE_MAX_GAP_S, SEQUENCE_MAX_IMAGES, SEQUENCE_CLASSIFY_CROPS, SEQUENCE_PROBE_IMAGES
+from config import SEQUENCE_SKIP_BLANK_BURSTS
+from pipeline import Pipeline, Stage
+from backends import load_backend
+from model_registry import get_models
+from result_log import MegaDetectorLog, ResultLog, excel_from_log
+from manifest import ProcessingManifest
+from detection_cache import DetectionCache
+from duplicate_index import DuplicateIndex, dhash
+from sequences import iter_sequences, capture_time
+from file_utils import is_image, file_sha256, iter_media_files, link_or_copy
+
 # ============================================================
 # SUPPRESS YOLOv5 AMP FUTURE WARNING
 # ============================================================
@@ -104,155 +133,863 @@ def target_is_animals_all(target_classes) -> bool:
             return True
     return False
 
+def matches_targets(labels, target_classes=None, detection_mode=None) -> bool:
+    """labels: class names of the boxes kept in an image / frame"""
+    if not labels:
+        return False
+    if detection_mode == "human" or not target_classes or target_is_animals_all(target_classes):
+        return True
+    targets = [tc.lower() for tc in target_classes]
+    return any(s.lower() in targets for s in labels)
+
 # ============================================================
 # LOAD MEGADETECTOR (YOLOv5) — CORRECT WAY
 # ============================================================
 import torch.serialization
 from yolov5.models.yolo import Model
 from yolov5.models.common import AutoShape
+from yolov5.utils.general import make_divisible, non_max_suppression, scale_boxes
 
 torch.serialization.add_safe_globals({Model: Model})
 
-ckpt = torch.load(
-    MEGADETECTOR_PATH,
-    map_location=DEVICE,
-    weights_only=False,
-)
 
-md_model = ckpt["model"].float().to(DEVICE)
+def _load_eager_megadetector():
+    ckpt = torch.load(
+        MEGADETECTOR_PATH,
+        map_location=DEVICE,
+        weights_only=False,
+    )
+    return ckpt["model"].float().to(DEVICE)
+
 
-# 🔑 THIS IS THE CRITICAL FIX
-md_model = AutoShape(md_model)
-md_model.eval()
+def load_megadetector(backend=MD_BACKEND):
+    if backend == "pytorch":
+        md_model = _load_eager_megadetector()
+    else:
+        # exported once, then loaded through DetectMultiBackend
+        md_model = load_backend(
+            backend,
+            Path(MEGADETECTOR_PATH),
+            model_hashes()["md_hash"],
+            _load_eager_megadetector,
+            DEVICE,
+            CACHE_DIR,
+            MD_INPUT_SIZE,
+        )
+
+    # 🔑 THIS IS THE CRITICAL FIX
+    md_model = AutoShape(md_model)
+    md_model.eval()
+
+    md_model.conf = 0.30
+    md_model.iou = 0.45
+    # NMS is per class, so keeping every class and filtering afterwards (see _md_class)
+    # gives the same boxes and lets one set of raw detections serve every detection mode
+    md_model.classes = None
+    return md_model
 
-md_model.conf = 0.30
-md_model.iou = 0.45
-md_model.classes = [0]  # animal by default
 
 # ============================================================
 # LOAD SPECIESNET
 # ============================================================
-print("[INFO] Loading SpeciesNet (explicit .pt + labels)...")
+def load_speciesnet():
+    print("[INFO] Loading SpeciesNet (explicit .pt + labels)...")
 
-classifier = SpeciesNetClassifier.__new__(SpeciesNetClassifier)
-classifier.device = DEVICE
+    classifier = SpeciesNetClassifier.__new__(SpeciesNetClassifier)
+    classifier.device = DEVICE
+
+    classifier.model = torch.load(
+        SPECIESNET_PT,
+        map_location=DEVICE,
+        weights_only=False,
+    )
+    classifier.model.eval()
+
+    for p in classifier.model.parameters():
+        p.requires_grad = False
+
+    with open(SPECIESNET_LABELS, "r", encoding="utf-8") as f:
+        classifier.labels = {i: line.strip() for i, line in enumerate(f.readlines())}
+
+    classifier.model_info = type(
+        "ModelInfoStub",
+        (),
+        {"type_": "full_image"},
+    )()
+
+    print(f"[INFO] Loaded {len(classifier.labels)} species classes")
+    return classifier
+
+
+def load_models():
+    """Called once by model_registry; everything else goes through get_models()."""
+    return load_megadetector(), load_speciesnet()
+
+
+# ============================================================
+# SHARED PREPROCESSING
+# - a decoded BGR frame is uploaded once as an RGB uint8 CHW tensor on DEVICE
+# - MegaDetector's letterbox and SpeciesNet's crop resize both read that
+#   buffer with tensor ops (no PIL round trip, no per-model numpy copies)
+# ============================================================
+def to_rgb_tensor(image):
+    """BGR uint8 HWC frame -> RGB uint8 CHW tensor on DEVICE"""
+    return torch.from_numpy(image).to(DEVICE).permute(2, 0, 1).flip(0)
+
+
+def _letterbox(rgb, shape):
+    """tensor version of yolov5's letterbox(auto=False): resize into `shape` (h, w), pad with grey"""
+    h, w = rgb.shape[1:]
+    r = min(shape[0] / h, shape[1] / w)
+    new_h, new_w = round(h * r), round(w * r)
+    x = rgb[None].float()
+    if (new_h, new_w) != (h, w):
+        x = F.interpolate(x, size=(new_h, new_w), mode="bilinear", align_corners=False)
+    top = round((shape[0] - new_h) / 2 - 0.1)
+    left = round((shape[1] - new_w) / 2 - 0.1)
+    return F.pad(x, (left, shape[1] - new_w - left, top, shape[0] - new_h - top), value=114.0)[0]
+
+
+# ============================================================
+# BATCHED MEGADETECTOR INFERENCE
+# - images are bucketed by aspect ratio so letterbox padding stays small
+# - one forward pass (+ NMS) per bucket, results split back per image
+# - same steps as AutoShape, on the shared tensors
+# ============================================================
+def _aspect_bucket(image):
+    h, w = image.shape[1:]
+    return round(w / h, ASPECT_BUCKET_PRECISION)
+
+
+def _md_forward(md_model, images):
+    shape0 = [tuple(image.shape[1:]) for image in images]
+    shape1 = getattr(md_model.model, "fixed_shape", None)  # traced backends take one input size only
+    if shape1 is None:
+        gains = [[int(y * MD_INPUT_SIZE / max(s)) for y in s] for s in shape0]
+        shape1 = [make_divisible(x, md_model.stride) for x in np.array(gains).max(0)]
+
+    p = next(md_model.model.parameters()) if md_model.pt else torch.empty(1, device=md_model.model.device)
+    x = torch.stack([_letterbox(image, shape1) for image in images]).type_as(p) / 255
+    with torch.no_grad():
+        y = md_model.model(x)
+    y = non_max_suppression(
+        y if md_model.dmb else y[0],
+        md_model.conf,
+        md_model.iou,
+        md_model.classes,
+        md_model.agnostic,
+        md_model.multi_label,
+        max_det=md_model.max_det,
+    )
+    for det, s in zip(y, shape0):
+        scale_boxes(shape1, det[:, :4], s)
+    return [det.cpu().numpy() for det in y]
 
-classifier.model = torch.load(
-    SPECIESNET_PT,
-    map_location=DEVICE,
-    weights_only=False,
-)
-classifier.model.eval()
 
-for p in classifier.model.parameters():
-    p.requires_grad = False
+def detect_batch(images, batch_size=IMAGE_BATCH_SIZE):
+    """
+    images: list of RGB CHW uint8 tensors (to_rgb_tensor)
+    returns one array of [x1, y1, x2, y2, conf, cls] rows (all classes) per image
+    """
+    md_model, _ = get_models()
 
-with open(SPECIESNET_LABELS, "r", encoding="utf-8") as f:
-    classifier.labels = {i: line.strip() for i, line in enumerate(f.readlines())}
+    buckets = {}
+    for i, image in enumerate(images):
+        buckets.setdefault(_aspect_bucket(image), []).append(i)
 
-classifier.model_info = type(
-    "ModelInfoStub",
-    (),
-    {"type_": "full_image"},
-)()
+    batch_size = min(batch_size, getattr(md_model.model, "max_batch", None) or batch_size)
+    detections = [None] * len(images)
+    for indices in buckets.values():
+        for start in range(0, len(indices), batch_size):
+            chunk = indices[start:start + batch_size]
+            for i, det in zip(chunk, _md_forward(md_model, [images[i] for i in chunk])):
+                detections[i] = det
+
+    return detections
+
+
+# ============================================================
+# BATCHED SPECIESNET CLASSIFICATION
+# - crops are views into the shared tensors, resized on DEVICE,
+#   stacked into a single tensor and classified in one forward pass
+# ============================================================
+def _crop(rgb, box):
+    h, w = rgb.shape[1:]
+    x1, y1, x2, y2 = box[:4]
+    return rgb[:, max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+
+
+def classify_batch(crops, top_k=SPECIES_TOP_K, batch_size=SPECIES_BATCH_SIZE):
+    """
+    crops: list of RGB CHW uint8 tensors (see _crop)
+    returns one {"classes": [...], "scores": [...]} top-k dict per crop (None for empty crops)
+    at most `batch_size` crops go through SpeciesNet per forward pass
+    """
+    results = [None] * len(crops)
+    valid = [i for i, crop in enumerate(crops) if crop is not None and crop.numel() > 0]
+    if not valid:
+        return results
+
+    _, classifier = get_models()
+
+    # same input as SpeciesNetClassifier.preprocess(...).arr / 255:
+    # bilinear resize to a square, uint8 levels, NHWC float in [0, 1]
+    size = (SPECIES_INPUT_SIZE, SPECIES_INPUT_SIZE)
+    for start in range(0, len(valid), batch_size):
+        chunk = valid[start:start + batch_size]
+        batch = torch.cat([
+            F.interpolate(crops[i][None].float(), size=size, mode="bilinear", align_corners=False)
+            for i in chunk
+        ])
+        batch = batch.round_().clamp_(0, 255).permute(0, 2, 3, 1) / 255
+        with torch.no_grad():
+            scores = torch.softmax(classifier.model(batch), dim=1)
+            top_scores, top_idx = torch.topk(scores, k=min(top_k, scores.shape[1]), dim=1)
+
+        for i, row_scores, row_idx in zip(chunk, top_scores.cpu().tolist(), top_idx.cpu().tolist()):
+            results[i] = {
+                "classes": [classifier.labels[j] for j in row_idx],
+                "scores": row_scores,
+            }
+    return results
+
+
+def _top_species(classification):
+    if not classification:
+        return "Unknown", 0.0
+    return clean_species_name(classification["classes"][0]), classification["scores"][0]
+
+
+# ============================================================
+# PER-CAMERA BACKGROUND PRE-FILTER (images)
+# - one running median of recent low-res frames per camera folder
+# - frames that barely differ from it (wind, sun) are called blank
+#   without running MegaDetector
+# - only blank frames are learned: rejected ones, and ones MegaDetector
+#   found nothing in, so a resting animal never becomes background
+# - a scene change (camera moved, branch fell) shows up as blank frames
+#   that MegaDetector confirms but that differ from the background; after
+#   BACKGROUND_RESET_FRAMES of those in a row the background is rebuilt from them
+# - every Nth rejected image is copied to an audit folder for checking
+# ============================================================
+class CameraBackground:
+    def __init__(self, history=BACKGROUND_HISTORY, width=BACKGROUND_WIDTH):
+        self.frames = deque(maxlen=history)
+        self.changed = []  # confirmed blank frames that did not match the background, in a row
+        self.width = width
+
+    def thumbnail(self, image):
+        h, w = image.shape[:2]
+        small = cv2.resize(image, (self.width, max(1, int(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (3, 3), 0).astype(np.float32)
+
+    def difference(self, gray, pixel_threshold):
+        """fraction of pixels of a thumbnail that differ from the median background (None until there is one)"""
+        if self.frames and self.frames[0].shape != gray.shape:
+            self.frames.clear()  # camera changed resolution / orientation
+            self.changed = []
+        if not self.frames:
+            return None
+        background = np.median(np.stack(self.frames), axis=0)
+        # a global brightness change (sun, cloud) is not an animal
+        diff = np.abs((gray - gray.mean()) - (background - background.mean()))
+        return float(np.count_nonzero(diff > pixel_threshold)) / diff.size
+
+    def learn(self, gray, matched, reset_frames):
+        """add a blank thumbnail; matched: it looked like the background when it was scored"""
+        if matched or not self.frames:
+            self.changed = []
+            self.frames.append(gray)
+            return
+        self.changed.append(gray)
+        if len(self.changed) >= reset_frames:
+            # the scene itself has changed: start the background over from the new view
+            self.frames.clear()
+            self.frames.extend(self.changed)
+            self.changed = []
+
+
+class BackgroundFilter:
+    def __init__(self, pixel_threshold=BACKGROUND_PIXEL_THRESHOLD, min_area=BACKGROUND_MIN_AREA, warmup=BACKGROUND_WARMUP_FRAMES, audit_every=BACKGROUND_AUDIT_EVERY, reset_frames=BACKGROUND_RESET_FRAMES):
+        """
+        pixel_threshold: grey-level change for a pixel to count as changed (lower = fewer rejections)
+        min_area: fraction of changed pixels below which an image is blank (lower = fewer rejections)
+        warmup: confirmed blank frames a camera's background is built from before anything is rejected
+        reset_frames: confirmed blank frames in a row that differ from the background before it is rebuilt
+        """
+        self.pixel_threshold = pixel_threshold
+        self.min_area = min_area
+        self.warmup = warmup
+        self.audit_every = audit_every
+        self.reset_frames = reset_frames
+        self.cameras = {}  # folder -> CameraBackground
+        self.rejected = 0
+        self._lock = threading.Lock()  # is_blank runs in the background stage, confirm_blank in detect
+
+    def is_blank(self, folder, image):
+        """
+        (blank, sample): blank frames are learned right away; otherwise pass `sample`
+        to confirm_blank once MegaDetector has found nothing in the frame
+        """
+        with self._lock:
+            camera = self.cameras.setdefault(folder, CameraBackground())
+            gray = camera.thumbnail(image)
+            score = camera.difference(gray, self.pixel_threshold)
+            matched = score is not None and score < self.min_area
+            blank = matched and len(camera.frames) >= self.warmup
+            if blank:
+                camera.learn(gray, True, self.reset_frames)
+                self.rejected += 1
+                return True, None
+            return False, (folder, gray, matched)
+
+    def confirm_blank(self, sample):
+        """MegaDetector found nothing in a frame is_blank let through: learn it as background"""
+        folder, gray, matched = sample
+        with self._lock:
+            self.cameras[folder].learn(gray, matched, self.reset_frames)
+
+    def audit_due(self):
+        """call after a rejection: True for every `audit_every`-th rejected image"""
+        return self.audit_every > 0 and self.rejected % self.audit_every == 1 % self.audit_every
+
+
+_background_filter = None
+_background_lock = threading.Lock()
+
+
+def background_filter():
+    global _background_filter
+    if not BACKGROUND_FILTER_ENABLED:
+        return None
+    with _background_lock:
+        if _background_filter is None:
+            _background_filter = BackgroundFilter()
+    return _background_filter
 
-print(f"[INFO] Loaded {len(classifier.labels)} species classes")
 
 # ============================================================
 # IMAGE PROCESSING
+# - split into stages (decode -> background -> detect -> classify -> annotate -> write)
+#   so they can run back to back or as a queue-connected pipeline
 # ============================================================
-def process_image(img_path: Path, out_dir: Path, stop_flag=None, target_classes=None, detection_mode=None):
+class ImageJob:
+    def __init__(self, path: Path, out_dir: Path):
+        self.path = path
+        self.out_dir = out_dir
+        self.image = None            # decoded BGR frame (dropped once written)
+        self.rgb = None              # shared model input made from `image` (to_rgb_tensor), dropped after classify
+        self.scale = 1               # full-resolution pixels per `image` pixel (reduced JPEG decode)
+        self.detections = None       # raw MegaDetector rows [x1, y1, x2, y2, conf, cls], all classes
+        self.boxes = []              # rows kept for this mode: (x1, y1, x2, y2, conf, row index)
+        self.classifications = {}    # SpeciesNet top-k per row index
+        self.species = []            # (species_name, species_conf) per box
+        self.cache_key = None
+        self.cache_dirty = False     # detections/classifications not yet in the cache
+        self.duplicate_of = None     # earlier copy of this image whose results were reused
+        self.background = None       # background-filter sample, learned if MegaDetector finds the frame blank
+        self.save_path = None
+        self.info = None             # result dict for the report, None if not saved
+
+# Jobs travel through the stages in groups: a burst of one trigger when
+# SEQUENCE_GROUPING is on (MegaDetector / SpeciesNet results are shared
+# within the group), a single image otherwise.
+
+
+def _keep_box(x1, y1, x2, y2):
+    return (x2 - x1) >= MIN_BOX_SIZE and (y2 - y1) >= MIN_BOX_SIZE
+
+
+def _md_class(detection_mode=None):
+    return 1 if detection_mode == "human" else 0  # MegaDetector: 0 animal, 1 person, 2 vehicle
+
+
+def _ensure_image(job: ImageJob):
+    """full-resolution frame: cache hits and reduced decodes are (re)decoded only when pixels are really needed"""
+    if job.image is None or job.scale != 1:
+        job.image = cv2.imdecode(np.fromfile(str(job.path), dtype=np.uint8), cv2.IMREAD_COLOR)
+        job.scale = 1
+    return job.image
+
+
+_REDUCED_DECODE = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def _decode_reduction(path: Path):
+    """largest JPEG scale-down (libjpeg decodes 1/2, 1/4, 1/8 directly) that keeps MegaDetector's input size"""
+    if not REDUCED_DECODE_ENABLED or path.suffix.lower() not in (".jpg", ".jpeg"):
+        return 1
+    try:
+        with Image.open(path) as img:  # header only
+            longest = max(img.size)
+    except OSError:
+        return 1
+    for factor in (8, 4, 2):
+        if longest // factor >= MD_INPUT_SIZE:
+            return factor
+    return 1
+
+
+def _decode_for_detector(path: Path):
+    return cv2.imdecode(np.fromfile(str(path), dtype=np.uint8), _REDUCED_DECODE.get(_decode_reduction(path), cv2.IMREAD_COLOR))
+
+
+def detector_input(path: Path, size=MD_INPUT_SIZE):
+    """letterboxed 1 x 3 x size x size float input in [0, 1] for one image file (calibration data)"""
+    image = _decode_for_detector(path)
+    if image is None:
+        return None
+    return (_letterbox(to_rgb_tensor(image), (size, size))[None] / 255).cpu().numpy()
 
-    if stop_flag and stop_flag.is_set():
+
+def detect_file(path: Path, md_model=None):
+    """
+    MegaDetector on one image file, decoded the way the image stages do it
+    returns [x1, y1, x2, y2, conf, cls] rows with coordinates normalised to [0, 1] (None if unreadable)
+    """
+    md_model = md_model or get_models()[0]
+    image = _decode_for_detector(path)
+    if image is None:
         return None
+    det = _md_forward(md_model, [to_rgb_tensor(image)])[0]
+    h, w = image.shape[:2]
+    det[:, [0, 2]] /= w
+    det[:, [1, 3]] /= h
+    return det
+
+
+def _image_groups(items):
+    """stream of image (path, out_dir) -> lists of (path, out_dir) processed together"""
+    if SEQUENCE_GROUPING:
+        return iter_sequences(items, SEQUENCE_MAX_GAP_S, SEQUENCE_MAX_IMAGES)
+    return ([item] for item in items)
+
+
+def _decode_job(job: ImageJob):
+    # read the bytes once: they are hashed for the cache and decoded from memory
+    data = np.fromfile(str(job.path), dtype=np.uint8)
+
+    cache = detection_cache()
+    if cache is not None:
+        job.cache_key = cache.key(hashlib.sha256(data.tobytes()).hexdigest())
+        record = cache.get(job.cache_key)
+        if record is not None:
+            job.detections = np.array(record["rows"], dtype=np.float32).reshape(-1, 6)
+            job.classifications = record["species"]
+            index = duplicate_index()
+            if index is not None:
+                job.duplicate_of = index.original(job.cache_key, str(job.path))
+            return
+
+    job.scale = _decode_reduction(job.path)
+    job.image = cv2.imdecode(data, _REDUCED_DECODE.get(job.scale, cv2.IMREAD_COLOR))
+
+    index = duplicate_index()
+    if index is not None and job.image is not None:
+        _reuse_duplicate(job, cache, index)
+
+
+def _reuse_duplicate(job: ImageJob, cache, index):
+    """re-encoded / resized copy of an image seen before: take over its raw results"""
+    h, w = (n * job.scale for n in job.image.shape[:2])
+    fingerprint = dhash(job.image)
+    taken = capture_time(job.path)
+    size = job.path.stat().st_size
+
+    for entry in index.find(fingerprint, taken, str(job.path), size):
+        record = cache.get(entry["key"])
+        if record is None:
+            continue  # other model settings, or the original is still in flight
+        rows = np.array(record["rows"], dtype=np.float32).reshape(-1, 6)
+        rows[:, [0, 2]] *= w / entry["width"]
+        rows[:, [1, 3]] *= h / entry["height"]
+        job.detections = rows
+        job.classifications = record["species"]
+        job.cache_dirty = True  # stored under this copy's own key: a plain cache hit next time
+        job.duplicate_of = entry["path"]
+        break
+
+    index.add(job.cache_key, fingerprint, taken, w, h, size, job.duplicate_of or str(job.path))
+
+
+def decode_stage(group):
+    for job in group:
+        _decode_job(job)
+    return group
+
+
+def background_stage(group):
+    """blank pre-filter: images that match their camera's background skip MegaDetector"""
+    bg = background_filter()
+    if bg is None:
+        return group
+    for job in group:
+        if job.detections is not None or job.image is None:
+            continue  # cached or unreadable
+        blank, job.background = bg.is_blank(job.path.parent, job.image)
+        if blank:
+            job.detections = np.zeros((0, 6), dtype=np.float32)  # blank, but not a detector result: never cached
+            job.image = None
+            if bg.audit_due():
+                link_or_copy(job.path, job.out_dir / BACKGROUND_AUDIT_DIR / job.path.name)
+    return group
+
+
+def _detect_jobs(jobs, target_cls):
+    todo = [job for job in jobs if job.detections is None and job.image is not None]
+    if todo:
+        for job in todo:
+            job.rgb = to_rgb_tensor(job.image)
+        detections = detect_batch([job.rgb for job in todo])
+        for job, det in zip(todo, detections):
+            det[:, :4] *= job.scale  # boxes (and the cache) are always in full-resolution pixels
+            job.detections = det
+            job.cache_dirty = True
+            if job.background is not None:
+                if not len(det):
+                    background_filter().confirm_blank(job.background)
+                job.background = None
+
+    for job in jobs:
+        if job.detections is None:
+            continue  # unreadable file
+        job.boxes = []
+        for row, (*xyxy, conf, cls) in enumerate(job.detections):
+            if int(cls) != target_cls:
+                continue
+            x1, y1, x2, y2 = map(int, xyxy)
+            if _keep_box(x1, y1, x2, y2):
+                job.boxes.append((x1, y1, x2, y2, float(conf), row))
 
-    image = cv2.imread(str(img_path))
-    detected_classes = set()
-    all_boxes = []
 
-    # Check if we should show species (skip for Animal All mode)
-    show_species = not target_is_animals_all(target_classes)
+def _blank_burst(group, probe):
+    # the first frames of the burst were read fine and none of them has a box for this mode
+    return len(group) > probe and all(job.detections is not None and not job.boxes for job in group[:probe])
 
-    # ---- SpeciesNet classification (only if showing species) ----
-    if show_species:
-        frame_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(frame_rgb)
 
-        pre_img = classifier.preprocess(pil_img)
-        result = classifier.predict(str(img_path), pre_img)
+def detect_stage(groups, detection_mode=None):
+    target_cls = _md_class(detection_mode)
+    # by default every frame runs MegaDetector; skipping blank bursts is opt-in
+    probe = SEQUENCE_PROBE_IMAGES if SEQUENCE_GROUPING and SEQUENCE_SKIP_BLANK_BURSTS else 0
 
-        if "classifications" in result:
-            raw_label = result["classifications"]["classes"][0]
-            species_conf = result["classifications"]["scores"][0]
-            species_name = clean_species_name(raw_label)
+    if not probe:
+        _detect_jobs([job for group in groups for job in group], target_cls)
+        return groups
+
+    # first frames of every burst, then the remaining frames of bursts that are not blank
+    _detect_jobs([job for group in groups for job in group[:probe]], target_cls)
+    rest = []
+    for group in groups:
+        if _blank_burst(group, probe):
+            for job in group[probe:]:
+                job.image = None  # MegaDetector skipped, nothing to save
         else:
-            species_name = "Unknown"
-            species_conf = 0.0
+            rest.extend(group[probe:])
+    _detect_jobs(rest, target_cls)
+    return groups
+
+
+def _classifier_crop(job: ImageJob, box):
+    # a crop from the reduced decode is enough while it still covers SpeciesNet's input size
+    if job.rgb is not None and job.scale != 1:
+        small = [v // job.scale for v in box[:4]]
+        if min(small[2] - small[0], small[3] - small[1]) >= SPECIES_INPUT_SIZE:
+            return _crop(job.rgb, small)
+    if job.rgb is None or job.scale != 1:
+        job.rgb = to_rgb_tensor(_ensure_image(job))  # full resolution
+    return _crop(job.rgb, box)
+
+
+def _classify_missing(picks):
+    """picks: (job, box) pairs; classifies the crops that have no cached result in one forward pass"""
+    missing = [(job, box) for job, box in picks if box[5] not in job.classifications]
+    crops = [_classifier_crop(job, box) for job, box in missing]
+    for (job, box), classification in zip(missing, classify_batch(crops)):
+        job.classifications[box[5]] = classification
+        job.cache_dirty = True
+
+
+def _best_boxes(group, count=SEQUENCE_CLASSIFY_CROPS):
+    """the burst's `count` most useful crops: confident and large"""
+    picks = [(job, box) for job in group for box in job.boxes]
+    picks.sort(key=lambda p: p[1][4] * (p[1][2] - p[1][0]) * (p[1][3] - p[1][1]), reverse=True)
+    return picks[:count]
+
+
+def _sequence_species(picks):
+    """picks: (job, box) pairs of one burst -> (species_name, species_conf) shared by every box of the burst"""
+    # top-k scores of every crop, weighted by the detector confidence of its box
+    votes = {}
+    total = 0.0
+    for job, box in picks:
+        classification = job.classifications.get(box[5])
+        if not classification:
+            continue
+        total += box[4]
+        for label, score in zip(classification["classes"], classification["scores"]):
+            name = clean_species_name(label)
+            votes[name] = votes.get(name, 0.0) + box[4] * score
+    if not votes:
+        return "Unknown", 0.0
+    name = max(votes, key=votes.get)
+    return name, votes[name] / total
+
+
+def classify_stage(groups, target_classes=None):
+    # Check if we should show species (skip for Animal All mode)
+    show_species = not target_is_animals_all(target_classes)
+
+    # detector-first gating: blank frames (no box left after the size filter) never reach SpeciesNet
+    jobs = [job for group in groups for job in group]
+    jobs_with_boxes = [job for job in jobs if job.boxes]
+
+    if not show_species:
+        for job in jobs_with_boxes:
+            job.species = [("Animal", 1.0)] * len(job.boxes)
+    elif SEQUENCE_GROUPING:
+        # one label per burst, from its best crops (all bursts of the batch in one forward pass)
+        picks = [_best_boxes(group) for group in groups]
+        _classify_missing([pick for group_picks in picks for pick in group_picks])
+        for group, group_picks in zip(groups, picks):
+            if group_picks:
+                label = _sequence_species(group_picks)
+                for job in group:
+                    job.species = [label] * len(job.boxes)
     else:
-        species_name = "Animal"
-        species_conf = 1.0
+        # every crop not classified yet (in any image of the batch) goes through one SpeciesNet forward pass
+        _classify_missing([(job, box) for job in jobs_with_boxes for box in job.boxes])
+        for job in jobs_with_boxes:
+            job.species = [_top_species(job.classifications[box[5]]) for box in job.boxes]
+
+    for job in jobs:
+        job.rgb = None  # only annotation (BGR) is left
+
+    cache = detection_cache()
+    if cache is not None:
+        for job in jobs:
+            if job.cache_dirty and job.cache_key:
+                cache.put(job.cache_key, job.detections, job.classifications)
+                job.cache_dirty = False
+
+    return groups
+
+
+def _image_size(job: ImageJob):
+    """(width, height) at full resolution, as cv2 decodes it (EXIF orientation applied)"""
+    if job.image is not None:
+        return job.image.shape[1] * job.scale, job.image.shape[0] * job.scale
+    with Image.open(job.path) as img:  # header only
+        w, h = img.size
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):  # rotated by 90 degrees
+            w, h = h, w
+    return w, h
+
+
+def _draw_boxes(image, boxes, factor=1.0):
+    """boxes in full-resolution pixels, `factor` = image pixels per full-resolution pixel"""
+    for x1, y1, w, h, species_name, display_conf in boxes:
+        x1, y1, w, h = (int(v * factor) for v in (x1, y1, w, h))
+        display_label = f"{species_name} {display_conf:.2f}"
+        cv2.rectangle(image, (x1, y1), (x1 + w, y1 + h), (0, 255, 0), 2)
+        cv2.putText(
+            image,
+            display_label,
+            (x1, max(y1 - 10, 20)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.6,
+            (0, 255, 0),
+            2,
+        )
+
+
+def _preview_image(job: ImageJob):
+    """(frame, factor) for a preview IMAGE_PREVIEW_WIDTH wide, from the reduced decode when it is large enough"""
+    if job.image is None or job.image.shape[1] < IMAGE_PREVIEW_WIDTH:
+        _ensure_image(job)
+    image = job.image
+    if image is None:
+        return None, 1.0
+    factor = 1.0 / job.scale
+    h, w = image.shape[:2]
+    if w > IMAGE_PREVIEW_WIDTH:
+        r = IMAGE_PREVIEW_WIDTH / w
+        image = cv2.resize(image, (IMAGE_PREVIEW_WIDTH, max(1, int(h * r))), interpolation=cv2.INTER_AREA)
+        factor *= r
+    return image, factor
+
+
+def _md_bbox(x1, y1, w, h, width, height):
+    """full-resolution x, y, w, h -> MegaDetector's normalised box, kept inside [0, 1]"""
+    x = min(max(float(x1) / width, 0.0), 1.0)
+    y = min(max(float(y1) / height, 0.0), 1.0)
+    w = min(max(float(w) / width, 0.0), 1.0 - x)
+    h = min(max(float(h) / height, 0.0), 1.0 - y)
+    return [round(v, 4) for v in (x, y, w, h)]
+
+
+def _md_record(job: ImageJob, boxes, size):
+    """this image for the run's MegaDetector batch-output file; size: full-resolution (width, height)"""
+    width, height = size
+    return {
+        "file": str(job.save_path),
+        "detections": [
+            {
+                "category": str(int(cls) + 1),  # MegaDetector ids: "1" animal, "2" person, "3" vehicle
+                "conf": round(float(md_conf), 4),
+                "bbox": _md_bbox(x1, y1, w, h, width, height),
+                "species": species_name,
+                "species_conf": round(float(species_conf), 4),
+            }
+            for (x1, y1, w, h, species_name, species_conf), md_conf, cls in boxes
+        ],
+    }
 
-    species_label = f"{species_name} {species_conf:.2f}"
 
-    # ---- MegaDetector ----
-    md_model.classes = [1] if detection_mode == "human" else [0]
+def _annotate_job(job: ImageJob, target_classes=None, detection_mode=None):
+    if job.detections is None:
+        return
 
-    results = md_model(image)
+    detected_classes = set()
+    all_boxes = []
+    md_rows = []
 
-    if results.xyxy and results.xyxy[0] is not None:
-        for *xyxy, conf, cls in results.xyxy[0].cpu().numpy():
-            x1, y1, x2, y2 = map(int, xyxy)
-            if (x2 - x1) < 40 or (y2 - y1) < 40:
-                continue
+    show_species = not target_is_animals_all(target_classes)
 
-            # Skip blank detections - don't draw or save
-            if species_name.lower() == "blank":
-                continue
+    for (x1, y1, x2, y2, conf, row), (species_name, species_conf) in zip(job.boxes, job.species):
 
-            # Use MegaDetector confidence for Animal (All) mode, species confidence otherwise
-            display_conf = conf if show_species == False else species_conf
-            display_label = f"{species_name} {display_conf:.2f}"
-
-            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(
-                image,
-                display_label,
-                (x1, max(y1 - 10, 20)),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
-                (0, 255, 0),
-                2,
-            )
-            detected_classes.add(species_name)
-            all_boxes.append((x1, y1, x2 - x1, y2 - y1, species_name))
-
-    if detection_mode == "human":
-        should_save = len(all_boxes) > 0
-    elif target_classes:
-        if target_is_animals_all(target_classes):
-            should_save = len(all_boxes) > 0
-        else:
-            should_save = any(
-                s.lower() in [tc.lower() for tc in target_classes]
-                for s in detected_classes
-            )
-    else:
-        should_save = len(all_boxes) > 0
+        # Skip blank detections - don't draw or save
+        if species_name.lower() == "blank":
+            continue
 
-    if not should_save:
-        return None
+        # Use MegaDetector confidence for Animal (All) mode, species confidence otherwise
+        display_conf = conf if show_species == False else species_conf
+        detected_classes.add(species_name)
+        all_boxes.append((x1, y1, x2 - x1, y2 - y1, species_name, display_conf))
+        md_rows.append((conf, job.detections[row][5]))
 
-    save_path = out_dir / img_path.name
-    cv2.imwrite(str(save_path), image)
+    should_save = matches_targets(detected_classes, target_classes, detection_mode)
 
-    return {
-        "filename": img_path.name,
-        "filepath": str(img_path),
+    if not should_save:
+        job.image = None  # free the frame, nothing to write
+        return
+
+    size = _image_size(job)  # before a preview replaces the frame (and its scale no longer applies)
+    if IMAGE_OUTPUT_MODE == "link":
+        # original bytes untouched, boxes only go to the run's MegaDetector file
+        job.image = None
+    elif IMAGE_OUTPUT_MODE == "preview":
+        image, factor = _preview_image(job)
+        if image is None:
+            return
+        _draw_boxes(image, all_boxes, factor)
+        job.image = image
+    else:
+        image = _ensure_image(job)
+        if image is None:
+            return
+        _draw_boxes(image, all_boxes)
+
+    job.save_path = job.out_dir / job.path.name
+    job.info = {
+        "filename": job.path.name,
+        "filepath": str(job.path),
         "type": "image",
         "num_detections": len(all_boxes),
         "classes": ", ".join(sorted(detected_classes)),
+        "megadetector": _md_record(job, [(box, conf, cls) for box, (conf, cls) in zip(all_boxes, md_rows)], size),
     }
 
+
+def annotate_stage(group, target_classes=None, detection_mode=None):
+    for job in group:
+        _annotate_job(job, target_classes, detection_mode)
+        if job.duplicate_of and job.info:
+            job.info["duplicate_of"] = job.duplicate_of
+        if SEQUENCE_GROUPING and job.info:
+            # burst id for the report: first frame of the sequence
+            job.info["sequence"] = group[0].path.name
+    return group
+
+
+def write_stage(group):
+    for job in group:
+        if job.save_path is not None and IMAGE_OUTPUT_MODE == "link":
+            link_or_copy(job.path, job.save_path)
+        elif job.save_path is not None and job.image is not None:
+            job.save_path.parent.mkdir(parents=True, exist_ok=True)
+            cv2.imwrite(str(job.save_path), job.image, [cv2.IMWRITE_JPEG_QUALITY, IMAGE_JPEG_QUALITY])
+        job.image = None
+    return group
+
+
+_writers = None
+_writers_lock = threading.Lock()
+
+
+def _writer_pool():
+    """output writer threads for run_image_groups (the pipeline has its own write stage workers)"""
+    global _writers
+    with _writers_lock:
+        if _writers is None:
+            _writers = ThreadPoolExecutor(PIPELINE_STAGE_WORKERS["write"], thread_name_prefix="image-writer")
+    return _writers
+
+
+def build_image_pipeline(stop_flag=None, target_classes=None, detection_mode=None, batch_size=IMAGE_BATCH_SIZE, stage_workers=None):
+    """Queue-connected decode -> background -> detect -> classify -> annotate -> write pipeline, fed with job groups."""
+    workers = dict(PIPELINE_STAGE_WORKERS)
+    workers.update(stage_workers or {})
+    sizes = PIPELINE_QUEUE_SIZE
+
+    return Pipeline(
+        [
+            Stage("decode", decode_stage, workers["decode"], queue_size=sizes["decode"]),
+            # per-camera history: one worker, frames in order
+            Stage("background", background_stage, 1, queue_size=sizes["background"]),
+            Stage("detect", lambda groups: detect_stage(groups, detection_mode), workers["detect"], batch_size, sizes["detect"]),
+            Stage("classify", lambda groups: classify_stage(groups, target_classes), workers["classify"], batch_size, sizes["classify"]),
+            Stage("annotate", lambda group: annotate_stage(group, target_classes, detection_mode), workers["annotate"], queue_size=sizes["annotate"]),
+            Stage("write", write_stage, workers["write"], queue_size=sizes["write"]),
+        ],
+        stop_flag=stop_flag,
+    )
+
+
+def process_image(img_path: Path, out_dir: Path, stop_flag=None, target_classes=None, detection_mode=None):
+    return process_image_batch([img_path], out_dir, stop_flag, target_classes, detection_mode)[0]
+
+
+def process_image_batch(img_paths, out_dir: Path, stop_flag=None, target_classes=None, detection_mode=None):
+    """returns one result dict (or None) per input path"""
+    groups = [[ImageJob(Path(p), Path(out_dir))] for p in img_paths]
+    run_image_groups(groups, stop_flag, target_classes, detection_mode)
+    return [group[0].info for group in groups]
+
+
+def run_image_groups(groups, stop_flag=None, target_classes=None, detection_mode=None):
+    """Run every stage back to back on the current thread, MegaDetector once per aspect bucket."""
+    if stop_flag and stop_flag.is_set():
+        return groups
+
+    for group in groups:
+        decode_stage(group)
+        background_stage(group)
+    detect_stage(groups, detection_mode)
+    classify_stage(groups, target_classes)
+
+    # writes overlap with annotating the next group
+    writes = []
+    for group in groups:
+        if stop_flag and stop_flag.is_set():
+            break
+        annotate_stage(group, target_classes, detection_mode)
+        writes.append(_writer_pool().submit(write_stage, group))
+    for write in writes:
+        write.result()
+
+    return groups
+
 # ============================================================
 # VIDEO PROCESSING
 # ============================================================
@@ -260,40 +997,170 @@ def process_image(img_path: Path, out_dir: Path, stop_flag=None, target_classes=
 # ============================================================
 # SIMPLE IOU-BASED TRACKER (lightweight alternative to ByteTrack/DeepSORT)
 # - assigns persistent `track_id` by IoU matching
+# - the full track x detection IoU matrix is computed in one NumPy call
+#   and solved globally (Hungarian: scipy if installed, else a NumPy version)
+# - tracks without a velocity yet also match on centre distance, gated by
+#   how far they can have moved since last seen (max_speed x frames elapsed),
+#   so a moving animal keeps its id across a long VIDEO_DETECTOR_INTERVAL
 # - caches species per `track_id` so SpeciesNet runs only when a new track appears
+# - one tracker per video, so tracks never carry over between files
 # ============================================================
-
-def _iou(boxA, boxB):
-    xA = max(boxA[0], boxB[0])
-    yA = max(boxA[1], boxB[1])
-    xB = min(boxA[2], boxB[2])
-    yB = min(boxA[3], boxB[3])
-    interW = max(0, xB - xA)
-    interH = max(0, yB - yA)
-    interArea = interW * interH
-    if interArea == 0:
-        return 0.0
-    boxAArea = max(0, (boxA[2] - boxA[0]) * (boxA[3] - boxA[1]))
-    boxBArea = max(0, (boxB[2] - boxB[0]) * (boxB[3] - boxB[1]))
-    return interArea / float(boxAArea + boxBArea - interArea)
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # _hungarian below gives the same assignment
+    linear_sum_assignment = None
+
+
+def _iou_matrix(boxes_a, boxes_b):
+    """IoU of every [x1,y1,x2,y2] in boxes_a (N) against every box in boxes_b (M) -> (N, M)"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+
+    inter_w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+
+    area_a = np.clip(a[:, 2] - a[:, 0], 0, None) * np.clip(a[:, 3] - a[:, 1], 0, None)
+    area_b = np.clip(b[:, 2] - b[:, 0], 0, None) * np.clip(b[:, 3] - b[:, 1], 0, None)
+    union = area_a[:, None] + area_b[None, :] - inter
+
+    return np.where(inter > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def _hungarian(cost):
+    """
+    minimum-cost assignment of a (N, M) cost matrix (shortest augmenting paths, O(N^2 M));
+    same result as scipy's linear_sum_assignment, used when scipy is missing
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # 1-based potentials / matching as in the textbook formulation; column 0 is a virtual start
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of = np.zeros(m + 1, dtype=int)  # row matched to each column, 0 = free
+    for i in range(1, n + 1):
+        row_of[0] = i
+        j0 = 0
+        dist = np.full(m + 1, np.inf)
+        prev = np.zeros(m + 1, dtype=int)
+        used = np.zeros(m + 1, dtype=bool)
+        while row_of[j0]:
+            used[j0] = True
+            i0 = row_of[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            closer = free & (reduced < dist[1:])
+            dist[1:][closer] = reduced[closer]
+            prev[1:][closer] = j0
+            j1 = int(np.argmin(np.where(free, dist[1:], np.inf))) + 1
+            delta = dist[j1]
+            u[row_of[used]] += delta
+            v[used] -= delta
+            dist[1:][free] -= delta
+            j0 = j1
+        while j0:  # flip the augmenting path
+            j1 = prev[j0]
+            row_of[j0] = row_of[j1]
+            j0 = j1
+
+    cols = np.nonzero(row_of[1:])[0]
+    rows = row_of[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def _centre_distance_matrix(boxes_a, boxes_b):
+    """distance between box centres, in units of the larger side of each box in boxes_a -> (N, M)"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    ca = (a[:, :2] + a[:, 2:]) / 2
+    cb = (b[:, :2] + b[:, 2:]) / 2
+    size = np.maximum(np.maximum(a[:, 2] - a[:, 0], a[:, 3] - a[:, 1]), 1.0)
+    return np.linalg.norm(ca[:, None] - cb[None, :], axis=2) / size[:, None]
+
+
+def associate(track_boxes, det_boxes, iou_threshold, gated=None):
+    """
+    returns (matches [(track_idx, det_idx)], unmatched track indices, unmatched detection indices)
+    gated: {track index: gate} for tracks without a velocity yet; if IoU cannot match them
+           they may still take a leftover detection whose centre is within `gate` box sizes
+    """
+    if len(track_boxes) == 0 or len(det_boxes) == 0:
+        return [], list(range(len(track_boxes))), list(range(len(det_boxes)))
+
+    iou = _iou_matrix(track_boxes, det_boxes)
+    solve = linear_sum_assignment if linear_sum_assignment is not None else _hungarian
+    rows, cols = solve(-iou)
+
+    keep = iou[rows, cols] >= iou_threshold
+    matches = list(zip(rows[keep].tolist(), cols[keep].tolist()))
+
+    # second pass: a new track's box is stale by a whole detector interval, so IoU alone
+    # misses a moving animal; its first re-match goes by centre distance instead
+    gated = gated or {}
+    free_t = [i for i in gated if i not in {r for r, _ in matches}]
+    free_d = [i for i in range(len(det_boxes)) if i not in {c for _, c in matches}]
+    if free_t and free_d:
+        dist = _centre_distance_matrix(
+            np.asarray(track_boxes, dtype=np.float64)[free_t], np.asarray(det_boxes, dtype=np.float64)[free_d]
+        )
+        dist /= np.array([gated[i] for i in free_t], dtype=np.float64)[:, None]  # 1.0 = at the gate
+        rows, cols = solve(np.minimum(dist, 2.0))
+        keep = dist[rows, cols] <= 1.0
+        matches += [(free_t[r], free_d[c]) for r, c in zip(rows[keep].tolist(), cols[keep].tolist())]
+
+    matches = sorted(matches)
+    matched_t = {r for r, _ in matches}
+    matched_d = {c for _, c in matches}
+    unmatched_t = [i for i in range(len(track_boxes)) if i not in matched_t]
+    unmatched_d = [i for i in range(len(det_boxes)) if i not in matched_d]
+    return matches, unmatched_t, unmatched_d
 
 
 class Track:
     def __init__(self, tid, bbox, species=None, last_seen=0):
         self.id = tid
-        self.bbox = bbox  # [x1,y1,x2,y2]
+        self.bbox = bbox  # [x1,y1,x2,y2] of the last matched detection
         self.species = species
         self.species_conf = 0.0
         self.last_seen = last_seen
         self.missed = 0
+        self.velocity = np.zeros(4)  # per-frame motion of [x1,y1,x2,y2] (constant-velocity model)
+
+    def predicted_bbox(self, frame_idx):
+        """Box moved forward along the track's velocity to `frame_idx`."""
+        dt = frame_idx - self.last_seen
+        if dt <= 0 or not self.velocity.any():
+            return self.bbox
+        return [int(round(v)) for v in np.asarray(self.bbox, dtype=np.float64) + self.velocity * dt]
+
+    def correct(self, bbox, frame_idx, smoothing=0.5):
+        """Update the velocity estimate from a new matched detection."""
+        dt = frame_idx - self.last_seen
+        if dt > 0:
+            measured = (np.asarray(bbox, dtype=np.float64) - np.asarray(self.bbox, dtype=np.float64)) / dt
+            if self.velocity.any():
+                self.velocity = smoothing * measured + (1.0 - smoothing) * self.velocity
+            else:
+                self.velocity = measured  # first estimate
+        self.bbox = bbox
+        self.last_seen = frame_idx
+        self.missed = 0
 
 
 class SimpleTracker:
-    def __init__(self, iou_threshold=0.3, max_age=30):
+    def __init__(self, iou_threshold=0.3, max_age=30, max_speed=0.3):
         self.tracks = {}
         self.next_id = 1
         self.iou_threshold = iou_threshold
         self.max_age = max_age
+        self.max_speed = max_speed  # box sizes per frame a track without velocity may have moved
 
     def update(self, detections, frame_idx):
         """
@@ -301,30 +1168,31 @@ class SimpleTracker:
         returns list of tuples (track_id, bbox, is_new)
         """
         assigned = []
-        unmatched = set(range(len(detections)))
-
-        # try to match existing tracks by IoU
-        for tid, track in list(self.tracks.items()):
-            best_iou = 0.0
-            best_det = -1
-            for di in list(unmatched):
-                i = _iou(track.bbox, detections[di])
-                if i > best_iou:
-                    best_iou = i
-                    best_det = di
-
-            if best_iou >= self.iou_threshold and best_det != -1:
-                det_bbox = detections[best_det]
-                track.bbox = det_bbox
-                track.last_seen = frame_idx
-                track.missed = 0
-                assigned.append((tid, det_bbox, False))
-                unmatched.remove(best_det)
-            else:
-                track.missed += 1
+        tids = list(self.tracks)
+
+        # match against where each track is expected to be now, not where it was last seen
+        matches, unmatched_tracks, unmatched = associate(
+            [self.tracks[tid].predicted_bbox(frame_idx) for tid in tids],
+            detections,
+            self.iou_threshold,
+            gated={
+                i: max(1.0, self.max_speed * (frame_idx - self.tracks[tid].last_seen))
+                for i, tid in enumerate(tids)
+                if not self.tracks[tid].velocity.any()
+            },
+        )
+
+        for ti, di in matches:
+            tid = tids[ti]
+            det_bbox = detections[di]
+            self.tracks[tid].correct(det_bbox, frame_idx)
+            assigned.append((tid, det_bbox, False))
+
+        for ti in unmatched_tracks:
+            self.tracks[tids[ti]].missed += 1
 
         # create new tracks for remaining detections
-        for di in list(unmatched):
+        for di in unmatched:
             bbox = detections[di]
             tid = self.next_id
             self.next_id += 1
@@ -339,14 +1207,14 @@ class SimpleTracker:
         return assigned
 
     def predict(self, frame_idx):
-        """Return current tracks as assigned when detector is skipped.
+        """Return current tracks, moved along their velocity, when detector is skipped.
         Increments missed for each track (no detection this frame).
         """
         assigned = []
         for tid, tr in list(self.tracks.items()):
             tr.missed += 1
             if tr.missed <= self.max_age:
-                assigned.append((tid, tr.bbox, False))
+                assigned.append((tid, tr.predicted_bbox(frame_idx), False))
 
         # remove stale tracks
         stale = [tid for tid, tr in self.tracks.items() if tr.missed > self.max_age]
@@ -356,255 +1224,768 @@ class SimpleTracker:
         return assigned
 
 
-# single global tracker instance used for video processing
-video_tracker = SimpleTracker(iou_threshold=0.3, max_age=30)
+# ============================================================
+# MOTION GATE
+# - cheap activity score on a small, blurred grayscale copy of the frame
+# - running-average background, learned over the first `warmup` analysed frames
+#   (the detector always runs during warm-up)
+# - frames without enough changed pixels skip MegaDetector
+# ============================================================
+class MotionGate:
+    def __init__(self, pixel_threshold=MOTION_PIXEL_THRESHOLD, min_area=MOTION_MIN_AREA, warmup=MOTION_WARMUP_FRAMES, width=MOTION_GATE_WIDTH, learning_rate=0.05):
+        """
+        pixel_threshold: grey-level change for a pixel to count as moving (lower = more sensitive)
+        min_area: fraction of moving pixels needed to call the detector (lower = more sensitive)
+        """
+        self.pixel_threshold = pixel_threshold
+        self.min_area = min_area
+        self.warmup = warmup
+        self.width = width
+        self.learning_rate = learning_rate
+        self.background = None
+        self.seen = 0
+
+    def _small_gray(self, frame):
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, int(h * self.width / w))) if w > self.width else (w, h)
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def score(self, frame):
+        """Fraction of pixels that differ from the background; also updates the background."""
+        gray = self._small_gray(frame)
+        self.seen += 1
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            return 1.0
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def moving(self, frame):
+        score = self.score(frame)
+        return self.seen <= self.warmup or score >= self.min_area
 
-def process_video(video_path: Path, out_dir: Path, stop_flag=None, target_classes=None, detection_mode=None, detector_interval=5, detector_width=512):
+
+# ============================================================
+# ASYNC VIDEO WRITER
+# - cv2.VideoWriter runs on its own thread so encoding overlaps with
+#   decoding and inference of the next frames
+# - bounded queue: write() blocks (back-pressure) once `queue_size` frames wait
+# - release() flushes the queue and closes the file, also after a stop or an error
+# ============================================================
+class AsyncVideoWriter:
+    def __init__(self, path: Path, fps, size, queue_size=VIDEO_WRITER_QUEUE_SIZE):
+        self._writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="video-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is None:
+                    break
+                if self._error is not None:
+                    continue  # keep draining so write() never blocks forever
+                try:
+                    self._writer.write(frame)
+                except Exception as e:
+                    self._error = e
+        finally:
+            self._writer.release()
+
+    def write(self, frame):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(frame)
+
+    def release(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+# ============================================================
+# CLIP RECORDER
+# - writes only the stretches of a video around matching frames
+# - a ring buffer of the last frames provides the pre-roll
+# - a clip ends after `post_roll` frames without a match
+# ============================================================
+class ClipRecorder:
+    def __init__(self, video_path: Path, out_dir: Path, fps, size, pre_roll_s=CLIP_PRE_ROLL_S, post_roll_s=CLIP_POST_ROLL_S):
+        self.video_path = video_path
+        self.out_dir = out_dir
+        self.fps = fps
+        self.size = size
+        self.post_roll = max(0, int(round(post_roll_s * fps)))
+        self.buffer = deque(maxlen=max(0, int(round(pre_roll_s * fps))))
+        self.writer = None
+        self.current = None     # [temp path, final path, first frame]
+        self.post_left = 0
+        self.clips = []         # (final path, first frame, last frame)
+        self.last_idx = 0
+
+    def _open(self, frame_idx):
+        n = len(self.clips) + 1
+        name = f"{self.video_path.stem}_clip{n:03d}{self.video_path.suffix}"
+        temp = self.out_dir / ("temp_" + name)
+        first = frame_idx - len(self.buffer)
+        self.writer = AsyncVideoWriter(temp, self.fps, self.size)
+        self.current = [temp, self.out_dir / name, first]
+        while self.buffer:
+            self.writer.write(self.buffer.popleft())
+
+    def _close(self, last_frame):
+        self.writer.release()
+        temp, final, first = self.current
+        if final.exists():
+            final.unlink()
+        os.replace(temp, final)
+        self.clips.append((final, first, last_frame))
+        self.writer = None
+        self.current = None
+
+    def push(self, frame, match, frame_idx):
+        if match:
+            if self.writer is None:
+                self._open(frame_idx)
+            self.writer.write(frame)
+            self.post_left = self.post_roll
+        elif self.writer is not None:
+            self.writer.write(frame)
+            self.post_left -= 1
+            if self.post_left <= 0:
+                self._close(frame_idx)
+        else:
+            self.buffer.append(frame)
+        self.last_idx = frame_idx
+
+    def finish(self):
+        """Close an open clip; returns [(path, start_s, end_s)]."""
+        if self.writer is not None:
+            self._close(self.last_idx)
+        self.buffer.clear()
+        return [(path, first / self.fps, last / self.fps) for path, first, last in self.clips]
+
+
+def process_video(video_path: Path, out_dir: Path, stop_flag=None, target_classes=None, detection_mode=None, detector_interval=VIDEO_DETECTOR_INTERVAL, detector_width=VIDEO_DETECTOR_WIDTH, video_mode=VIDEO_OUTPUT_MODE, motion_gate=MOTION_GATE_ENABLED, triage_frames=TRIAGE_CONFIRM_FRAMES):
+    """
+    video_mode:
+      "annotated" - decode every frame and write an annotated copy of the whole video
+      "scan"      - only decode frames the detector looks at (cap.grab() skips the rest),
+                    write nothing and link/copy the original video when it matches
+      "clips"     - write only the segments with matching tracks (plus pre/post roll)
+      "triage"    - like "scan", but stop as soon as `triage_frames` analysed frames
+                    confirmed a match (presence/absence surveys)
+    motion_gate: skip MegaDetector on analysed frames without motion (while no track is alive)
+    """
 
     cap = cv2.VideoCapture(str(video_path))
     if not cap.isOpened():
         return None
 
+    out_dir.mkdir(parents=True, exist_ok=True)
+
     fps = cap.get(cv2.CAP_PROP_FPS) or 25
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
+    triage = video_mode == "triage"
+    scan_only = video_mode == "scan" or triage
+
     temp_out = out_dir / ("temp_" + video_path.name)
-    writer = cv2.VideoWriter(
-        str(temp_out),
-        cv2.VideoWriter_fourcc(*"mp4v"),
-        fps,
-        (w, h),
-    )
+    writer = None
+    clips = None
+    if video_mode == "clips":
+        clips = ClipRecorder(video_path, out_dir, fps, (w, h))
+    elif not scan_only:
+        writer = AsyncVideoWriter(temp_out, fps, (w, h))
 
     # start timing for this video
     start_time = datetime.now()
 
+    # fresh tracker (and motion background) per video
+    video_tracker = SimpleTracker(iou_threshold=0.3, max_age=30)
+    gate = MotionGate() if motion_gate else None
+    detector_calls = 0
+
     detected_classes = set()
     any_detect = False
     has_matching_detection = False
+    first_match_idx = None
+    confirmed_frames = 0
 
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
     # Check if we should show species (skip for Animal All mode)
     show_species = not target_is_animals_all(target_classes)
 
-    for frame_idx in tqdm(range(total_frames), desc="Processing video", unit="frame"):
+    # writers are flushed and released even when the loop stops early or raises
+    try:
+        for frame_idx in tqdm(range(total_frames), desc="Processing video", unit="frame"):
 
-        if stop_flag and stop_flag.is_set():
-            break
+            if stop_flag and stop_flag.is_set():
+                break
 
-        ret, frame = cap.read()
-        if not ret:
-            break
+            analyse = frame_idx % detector_interval == 0
+
+            if scan_only and not analyse:
+                # nothing to detect, draw or write on this frame: skip decoding it
+                if not cap.grab():
+                    break
+                video_tracker.predict(frame_idx)
+                continue
 
-        all_boxes = []
+            ret, frame = cap.read()
+            if not ret:
+                break
 
-        # prepare scaled frame for faster detection/tracking/classification
-        orig_h, orig_w = frame.shape[:2]
-        target_w = int(detector_width)
-        if orig_w > target_w:
-            scale = target_w / orig_w
-        else:
-            scale = 1.0
+            all_boxes = []
 
-        scaled_w = max(1, int(orig_w * scale))
-        scaled_h = max(1, int(orig_h * scale))
-        if scale != 1.0:
-            scaled_frame = cv2.resize(frame, (scaled_w, scaled_h))
-        else:
-            scaled_frame = frame
-
-        # Run MegaDetector only every `detector_interval` frames (and on frame 0)
-        bbox_conf_map = {}
-        if frame_idx % detector_interval == 0:
-            md_model.classes = [1] if detection_mode == "human" else [0]
-            results = md_model(scaled_frame)
-
-            # collect raw detections in scaled frame coordinates for association
-            det_boxes = []
-            bbox_conf_map = {}  # Store MegaDetector confidence keyed by bbox tuple
-            if results.xyxy and results.xyxy[0] is not None:
-                for (*xyxy, conf, cls) in results.xyxy[0].cpu().numpy():
+            # prepare scaled frame for faster detection/tracking/classification
+            orig_h, orig_w = frame.shape[:2]
+            target_w = int(detector_width)
+            if orig_w > target_w:
+                scale = target_w / orig_w
+            else:
+                scale = 1.0
+
+            scaled_w = max(1, int(orig_w * scale))
+            scaled_h = max(1, int(orig_h * scale))
+            if scale != 1.0:
+                scaled_frame = cv2.resize(frame, (scaled_w, scaled_h))
+            else:
+                scaled_frame = frame
+
+            # motion gate: a still scene with no live tracks is not worth a detector call
+            if analyse and gate is not None and not gate.moving(scaled_frame) and not video_tracker.tracks:
+                analyse = False
+
+            # Run MegaDetector only every `detector_interval` frames (and on frame 0)
+            bbox_conf_map = {}
+            if analyse:
+                detector_calls += 1
+                rgb = to_rgb_tensor(scaled_frame)
+                target_cls = _md_class(detection_mode)
+
+                # collect raw detections in scaled frame coordinates for association
+                det_boxes = []
+                bbox_conf_map = {}  # Store MegaDetector confidence keyed by bbox tuple
+                for (*xyxy, conf, cls) in detect_batch([rgb])[0]:
+                    if int(cls) != target_cls:
+                        continue
                     x1s, y1s, x2s, y2s = map(int, xyxy)
-                    if (x2s - x1s) < 40 or (y2s - y1s) < 40:
+                    if not _keep_box(x1s, y1s, x2s, y2s):
                         continue
                     bbox = [x1s, y1s, x2s, y2s]
                     det_boxes.append(bbox)
                     bbox_conf_map[tuple(bbox)] = float(conf)
 
-            # update tracker with fresh detections (scaled coords)
-            assigned = video_tracker.update(det_boxes, frame_idx)
-        else:
-            # skip running detector — predict/return existing tracks (scaled coords)
-            assigned = video_tracker.predict(frame_idx)
-
-        # annotate frame and run SpeciesNet only for newly created tracks
-        for (tid, bbox, is_new) in assigned:
-            x1s, y1s, x2s, y2s = bbox
-            species_name = "Unknown"
-            species_conf = 0.0
-            bbox_conf = bbox_conf_map.get(tuple(bbox), 0.0)  # Get MegaDetector confidence
-
-            if is_new:
-                # crop and classify only for the new track using the scaled frame (if showing species)
-                if show_species:
-                    x1c = max(0, x1s)
-                    y1c = max(0, y1s)
-                    x2c = min(scaled_w, x2s)
-                    y2c = min(scaled_h, y2s)
-                    crop = scaled_frame[y1c:y2c, x1c:x2c]
-                    if crop.size > 0:
-                        crop_rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
-                        pil_crop = Image.fromarray(crop_rgb)
-                        pre_img = classifier.preprocess(pil_crop)
-                        result = classifier.predict(f"track_{tid}_frame_{frame_idx}", pre_img)
-                        if "classifications" in result:
-                            raw_label = result["classifications"]["classes"][0]
-                            species_conf = result["classifications"]["scores"][0]
-                            species_name = clean_species_name(raw_label)
-                else:
-                    # For Animal All mode use MegaDetector label/conf
-                    if detection_mode == "human":
-                        species_name = "Human"
-                        species_conf = bbox_conf
-                    else:
-                        species_name = "Animal"
-                        species_conf = bbox_conf
-                # cache into track (scaled coords)
-                video_tracker.tracks[tid].species = species_name
-                video_tracker.tracks[tid].species_conf = species_conf
+                # update tracker with fresh detections (scaled coords)
+                assigned = video_tracker.update(det_boxes, frame_idx)
             else:
-                # reuse cached species
-                tr = video_tracker.tracks.get(tid)
-                if tr is not None:
-                    species_name = tr.species or "Unknown"
-                    species_conf = getattr(tr, "species_conf", 0.0)
-
-            # Skip blank detections when species classifier returned blank
-            if show_species and species_name.lower() == "blank":
-                continue
-
-            # Determine display label
-            if detection_mode == "human":
-                display_label = f"Human {bbox_conf:.2f}"
-            elif show_species:
-                display_label = f"{species_name} {species_conf:.2f}"
-            else:
-                display_label = f"Animal {bbox_conf:.2f}"
+                # skip running detector — predict/return existing tracks (scaled coords)
+                assigned = video_tracker.predict(frame_idx)
+
+            # run SpeciesNet only for newly created tracks, all of this frame's new tracks in one batch
+            new_species = {}
+            if show_species:
+                new_tids = [tid for (tid, bbox, is_new) in assigned if is_new]
+                crops = [_crop(rgb, bbox) for (tid, bbox, is_new) in assigned if is_new]  # new tracks only come from a detector frame
+                for tid, classification in zip(new_tids, classify_batch(crops)):
+                    new_species[tid] = _top_species(classification)
+
+            # annotate frame
+            for (tid, bbox, is_new) in assigned:
+                x1s, y1s, x2s, y2s = bbox
+                species_name = "Unknown"
+                species_conf = 0.0
+                bbox_conf = bbox_conf_map.get(tuple(bbox), 0.0)  # Get MegaDetector confidence
+
+                if is_new:
+                    # classified above on the scaled frame (if showing species)
+                    if show_species:
+                        species_name, species_conf = new_species[tid]
+                    else:
+                        # For Animal All mode use MegaDetector label/conf
+                        if detection_mode == "human":
+                            species_name = "Human"
+                            species_conf = bbox_conf
+                        else:
+                            species_name = "Animal"
+                            species_conf = bbox_conf
+                    # cache into track (scaled coords)
+                    video_tracker.tracks[tid].species = species_name
+                    video_tracker.tracks[tid].species_conf = species_conf
+                else:
+                    # reuse cached species
+                    tr = video_tracker.tracks.get(tid)
+                    if tr is not None:
+                        species_name = tr.species or "Unknown"
+                        species_conf = getattr(tr, "species_conf", 0.0)
+
+                # Skip blank detections when species classifier returned blank
+                if show_species and species_name.lower() == "blank":
+                    continue
+
+                # Determine display label
+                if detection_mode == "human":
+                    display_label = f"Human {bbox_conf:.2f}"
+                elif show_species:
+                    display_label = f"{species_name} {species_conf:.2f}"
+                else:
+                    display_label = f"Animal {bbox_conf:.2f}"
 
-            # map bbox from scaled coords back to original frame coords for drawing/saving
-            if scale != 0:
-                inv_scale = 1.0 / scale
-            else:
-                inv_scale = 1.0
-            x1 = int(x1s * inv_scale)
-            y1 = int(y1s * inv_scale)
-            x2 = int(x2s * inv_scale)
-            y2 = int(y2s * inv_scale)
-
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(
-                frame,
-                display_label,
-                (x1, max(y1 - 10, 20)),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
-                (0, 255, 0),
-                2,
-            )
-            # record detected class for summaries
-            detected_classes.add("Human" if detection_mode == "human" else ("Animal" if not show_species else species_name))
-            all_boxes.append(species_name if show_species else ("Human" if detection_mode == "human" else "Animal"))
-
-        if all_boxes:
-            any_detect = True
-            if detection_mode == "human":
-                has_matching_detection = True
-            elif target_classes:
-                if target_is_animals_all(target_classes):
-                    has_matching_detection = True
+                # map bbox from scaled coords back to original frame coords for drawing/saving
+                if scale != 0:
+                    inv_scale = 1.0 / scale
                 else:
-                    has_matching_detection |= any(
-                        s.lower() in [tc.lower() for tc in target_classes]
-                        for s in detected_classes
+                    inv_scale = 1.0
+                x1 = int(x1s * inv_scale)
+                y1 = int(y1s * inv_scale)
+                x2 = int(x2s * inv_scale)
+                y2 = int(y2s * inv_scale)
+
+                if not scan_only:
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                    cv2.putText(
+                        frame,
+                        display_label,
+                        (x1, max(y1 - 10, 20)),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        0.6,
+                        (0, 255, 0),
+                        2,
                     )
-            else:
-                has_matching_detection = True
-
-        writer.write(frame)
-
-    cap.release()
-    writer.release()
+                # record detected class for summaries
+                detected_classes.add("Human" if detection_mode == "human" else ("Animal" if not show_species else species_name))
+                all_boxes.append(species_name if show_species else ("Human" if detection_mode == "human" else "Animal"))
+
+            frame_match = matches_targets(all_boxes, target_classes, detection_mode)
+            if all_boxes:
+                any_detect = True
+                has_matching_detection |= frame_match
+            if frame_match and first_match_idx is None:
+                first_match_idx = frame_idx
+
+            # triage: the answer is known once enough detector frames confirmed a match
+            if triage and analyse and frame_match:
+                confirmed_frames += 1
+                if confirmed_frames >= triage_frames:
+                    break
+
+            if writer is not None:
+                writer.write(frame)
+            elif clips is not None:
+                clips.push(frame, frame_match, frame_idx)
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+        clip_spans = clips.finish() if clips is not None else []
 
     # print elapsed time for this video processing
     elapsed = (datetime.now() - start_time).total_seconds()
-    print(f"[INFO] Video {video_path.name} processed in {elapsed:.2f}s")
+    print(f"[INFO] Video {video_path.name} processed in {elapsed:.2f}s ({detector_calls} detector calls)")
 
     if not any_detect or not has_matching_detection:
         temp_out.unlink(missing_ok=True)
         return None
 
-    final_out = out_dir / video_path.name
-    if final_out.exists():
-        final_out.unlink()
-    os.replace(temp_out, final_out)
-
-    return {
+    info = {
         "filename": video_path.name,
         "filepath": str(video_path),
         "type": "video",
         "num_detections": "multiple",
         "classes": ", ".join(sorted(detected_classes)),
+        "first_match_s": round(first_match_idx / fps, 2),
+    }
+
+    final_out = out_dir / video_path.name
+    if clips is not None:
+        info["clips"] = ", ".join(f"{p.name} ({a:.1f}-{b:.1f}s)" for p, a, b in clip_spans)
+    elif scan_only:
+        link_or_copy(video_path, final_out)
+    else:
+        if final_out.exists():
+            final_out.unlink()
+        os.replace(temp_out, final_out)
+
+    return info
+
+# ============================================================
+# RUN SETTINGS (used to decide whether earlier results are still valid)
+# ============================================================
+_model_hashes = {}
+
+
+def model_hashes():
+    """sha256 of the weight files, computed once per process."""
+    if not _model_hashes:
+        _model_hashes["md_hash"] = file_sha256(Path(MEGADETECTOR_PATH))
+        _model_hashes["species_hash"] = file_sha256(Path(SPECIESNET_PT))
+    return dict(_model_hashes)
+
+
+def run_settings(target_classes=None, detection_mode=None):
+    md_model, _ = get_models()
+    return {
+        **model_hashes(),
+        "target_classes": sorted(tc.lower() for tc in target_classes or []),
+        "detection_mode": detection_mode,
+        "md_conf": md_model.conf,
+        "md_iou": md_model.iou,
+        "min_box_size": MIN_BOX_SIZE,
+        "md_input_size": MD_INPUT_SIZE,
+        "md_input": "rgb",
+        "md_backend": MD_BACKEND,
+        "reduced_decode": REDUCED_DECODE_ENABLED,
+        "image_output": [IMAGE_OUTPUT_MODE, IMAGE_JPEG_QUALITY, IMAGE_PREVIEW_WIDTH],
+        "video_mode": VIDEO_OUTPUT_MODE,
+        "video_detector_interval": VIDEO_DETECTOR_INTERVAL,
+        "video_detector_width": VIDEO_DETECTOR_WIDTH,
+        "motion_gate": MOTION_GATE_ENABLED,
+        "triage_frames": TRIAGE_CONFIRM_FRAMES,
+        "background_filter": [BACKGROUND_WIDTH, BACKGROUND_HISTORY, BACKGROUND_WARMUP_FRAMES, BACKGROUND_RESET_FRAMES, BACKGROUND_PIXEL_THRESHOLD, BACKGROUND_MIN_AREA] if BACKGROUND_FILTER_ENABLED else None,
+        "duplicates": [DUPLICATE_MAX_DISTANCE, DUPLICATE_MAX_TIME_GAP_S] if DUPLICATE_DETECTION_ENABLED else None,
+        "sequences": [SEQUENCE_MAX_GAP_S, SEQUENCE_MAX_IMAGES, SEQUENCE_CLASSIFY_CROPS, SEQUENCE_PROBE_IMAGES if SEQUENCE_SKIP_BLANK_BURSTS else 0] if SEQUENCE_GROUPING else None,
     }
 
+
+# ============================================================
+# RAW-DETECTION CACHE + DUPLICATE INDEX (one per process, shared by the stage threads)
+# ============================================================
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_settings():
+    md_model, _ = get_models()
+    return {
+        **model_hashes(),
+        "md_conf": md_model.conf,
+        "md_iou": md_model.iou,
+        "md_input_size": MD_INPUT_SIZE,
+        "md_input": "rgb",
+        "md_backend": MD_BACKEND,
+        "reduced_decode": REDUCED_DECODE_ENABLED,
+        "species_top_k": SPECIES_TOP_K,
+    }
+
+
+def detection_cache():
+    global _cache
+    if not DETECTION_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = DetectionCache(CACHE_DIR, cache_settings())
+    return _cache
+
+
+_duplicates = None
+
+
+def duplicate_index():
+    """perceptual-hash index next to the cache (entries point at cache keys)"""
+    global _duplicates
+    if not DUPLICATE_DETECTION_ENABLED or detection_cache() is None:
+        return None
+    with _cache_lock:
+        if _duplicates is None:
+            _duplicates = DuplicateIndex(CACHE_DIR, DUPLICATE_MAX_DISTANCE, DUPLICATE_MAX_TIME_GAP_S)
+    return _duplicates
+
+
+# ============================================================
+# IN-PROCESS EXECUTION
+# - images stream through the staged pipeline as they are discovered,
+#   videos follow one by one
+# - yields (path, result dict or None) per file
+# ============================================================
+def _run_in_process(files, stop_flag=None, target_classes=None, detection_mode=None, batch_size=IMAGE_BATCH_SIZE, stage_workers=None):
+    videos = []
+
+    def images():
+        # runs on the pipeline's feeder thread
+        for path, out_dir in files:
+            if is_image(path):
+                yield path, out_dir
+            else:
+                videos.append((path, out_dir))
+
+    def job_groups():
+        for group in _image_groups(images()):
+            yield [ImageJob(path, out_dir) for path, out_dir in group]
+
+    pipeline = build_image_pipeline(stop_flag, target_classes, detection_mode, batch_size, stage_workers)
+    groups = pipeline.run(job_groups())
+    try:
+        for group in groups:
+            for job in group:
+                yield job.path, job.info
+    finally:
+        groups.close()
+
+    for file, out_dir in videos:
+
+        if stop_flag and stop_flag.is_set():
+            break
+
+        yield file, process_video(file, out_dir, stop_flag, target_classes, detection_mode)
+
+
+# ============================================================
+# MULTI-PROCESS CPU SHARDING (opt-in, CPU_WORKER_PROCESSES != 1)
+# - replaces the staged pipeline: workers run their tasks stage after
+#   stage themselves, so PIPELINE_STAGE_WORKERS / stage_workers are ignored
+# - each worker process loads MegaDetector + SpeciesNet once
+#   and gets an equal share of the torch intra-op threads
+# - workers take tasks (image batches / single videos) from the pool's shared queue
+# - the parent merges results and mirrors `stop_flag` to the workers
+# ============================================================
+_worker_settings = {}
+
+
+def _available_memory_gb():
+    """free physical RAM, None if it cannot be read"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            class MemoryStatus(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong)] + [
+                    (name, ctypes.c_ulonglong)
+                    for name in ("total_phys", "avail_phys", "total_page", "avail_page", "total_virtual", "avail_virtual", "avail_extended")
+                ]
+
+            status = MemoryStatus()
+            status.dwLength = ctypes.sizeof(MemoryStatus)
+            if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return None
+            return status.avail_phys / 1024 ** 3
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024 ** 3
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _resolve_processes(processes):
+    if processes:
+        return max(1, int(processes))
+    if torch.cuda.is_available():
+        return 1
+    count = (os.cpu_count() or 1) // CPU_THREADS_PER_WORKER
+    free_gb = _available_memory_gb()
+    if free_gb is not None:
+        # this process keeps its own copy of the models too
+        count = min(count, int(free_gb // CPU_WORKER_MEMORY_GB))
+    return max(1, count)
+
+
+def _init_worker(threads, stop_event, target_classes, detection_mode):
+    torch.set_num_threads(threads)
+    get_models()  # load once per worker, before the first task
+    _worker_settings.update(
+        stop_flag=stop_event,
+        target_classes=target_classes,
+        detection_mode=detection_mode,
+    )
+
+
+def _process_task(task):
+    """task: list of groups of (path, out_dir) — image groups, or a single video"""
+    cfg = _worker_settings
+    groups = [[(Path(p), Path(o)) for p, o in group] for group in task]
+    if is_image(groups[0][0][0]):
+        groups = [[ImageJob(p, o) for p, o in group] for group in groups]
+        run_image_groups(groups, cfg["stop_flag"], cfg["target_classes"], cfg["detection_mode"])
+        return [(job.path, job.info) for group in groups for job in group]
+    return [(p, process_video(p, o, cfg["stop_flag"], cfg["target_classes"], cfg["detection_mode"])) for p, o in groups[0]]
+
+
+def _pool_tasks(files, batch_size):
+    # image groups are packed into tasks of ~batch_size images as they stream in, videos go out on their own
+    videos = []
+
+    def images():
+        for path, out_dir in files:
+            if is_image(path):
+                yield path, out_dir
+            else:
+                videos.append([[(str(path), str(out_dir))]])
+
+    task = []
+    count = 0
+    for group in _image_groups(images()):
+        while videos:
+            yield videos.pop(0)
+        task.append([(str(p), str(o)) for p, o in group])
+        count += len(group)
+        if count >= batch_size:
+            yield task
+            task = []
+            count = 0
+    yield from videos
+    if task:
+        yield task
+
+
+def _run_process_pool(files, processes, stop_flag=None, target_classes=None, detection_mode=None, batch_size=IMAGE_BATCH_SIZE):
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    print(f"[INFO] Sharding files over {processes} processes x {threads} threads")
+
+    # spawn (not fork): torch and the GUI threads are not fork-safe
+    ctx = mp.get_context("spawn")
+    worker_stop = ctx.Event()
+    pool = ctx.Pool(
+        processes,
+        initializer=_init_worker,
+        initargs=(threads, worker_stop, target_classes, detection_mode),
+    )
+
+    finished = False
+    try:
+        # the pool's task handler pulls from the (streaming) task generator as workers free up
+        results = pool.imap_unordered(_process_task, _pool_tasks(files, batch_size), chunksize=1)
+        while True:
+            if stop_flag and stop_flag.is_set():
+                worker_stop.set()
+                break
+            try:
+                results_of_task = results.next(timeout=0.5)
+            except mp.TimeoutError:
+                continue
+            except StopIteration:
+                finished = True
+                break
+            yield from results_of_task
+    finally:
+        if finished:
+            pool.close()
+        else:
+            worker_stop.set()
+            pool.terminate()
+        pool.join()
+
+
+# ============================================================
+# INPUT DISCOVERY
+# - walks the input folder recursively while processing runs
+# - keeps a running total for the progress bar
+# - output folders mirror the input sub-folder layout
+# - files the manifest already has are set aside with their stored result
+# ============================================================
+class _Discovery:
+    def __init__(self, input_dir: Path, output_dir: Path, manifest: ProcessingManifest):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.manifest = manifest
+        self.total = 0
+        self.resumed = queue.SimpleQueue()  # (path, stored info)
+
+    def __iter__(self):
+        """yields (path, out_dir) for every file that still needs processing"""
+        for path in iter_media_files(self.input_dir, exclude=[self.output_dir]):
+            self.total += 1
+            already_done, info = self.manifest.lookup(path)
+            if already_done:
+                self.resumed.put((path, info))
+                continue
+            yield path, self.output_dir / path.parent.relative_to(self.input_dir)
+
+
 # ============================================================
 # MAIN ENTRY
 # ============================================================
-def run_detection(input_dir, output_dir, progress_cb, device_cb=None, stop_flag=None, target_classes=None, detection_mode=None):
+def run_detection(input_dir, output_dir, progress_cb, device_cb=None, stop_flag=None, target_classes=None, detection_mode=None, batch_size=IMAGE_BATCH_SIZE, stage_workers=None, processes=CPU_WORKER_PROCESSES):
 
     if device_cb:
         device_cb("GPU" if torch.cuda.is_available() else "CPU")
 
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
+    if output_dir.resolve() == input_dir.resolve():
+        # link / scan / triage outputs would land on the originals
+        raise ValueError("output folder must be different from the input folder")
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    from file_utils import is_image, is_video
-
-    files = [f for f in input_dir.iterdir() if f.is_file() and (is_image(f) or is_video(f))]
-    logs = []
-
     # start total run timer
     run_start = datetime.now()
+    stamp = f"{run_start:%Y%m%d_%H%M%S}"
 
-    should_continue = progress_cb(0, len(files))
+    should_continue = progress_cb(0, 0)
     if should_continue is False:
         return None, []
 
-    for idx, file in enumerate(files, 1):
-
-        if stop_flag and stop_flag.is_set():
-            break
+    # results are appended to disk as they arrive instead of being kept in memory
+    log = ResultLog(output_dir / f"detections_{stamp}.jsonl")
+    md_log = MegaDetectorLog(output_dir / f"megadetector_{stamp}.json", output_dir)
+    manifest = ProcessingManifest(output_dir, run_settings(target_classes, detection_mode))
+    discovery = _Discovery(input_dir, output_dir, manifest)
 
-        if is_image(file):
-            info = process_image(file, output_dir, stop_flag, target_classes, detection_mode)
+    processes = _resolve_processes(processes)
+    if processes > 1:
+        # pool mode: the staged pipeline (and stage_workers) is bypassed
+        results = _run_process_pool(discovery, processes, stop_flag, target_classes, detection_mode, batch_size)
+    else:
+        results = _run_in_process(discovery, stop_flag, target_classes, detection_mode, batch_size, stage_workers)
+
+    done = 0
+    resumed = 0
+
+    def report(info):
+        # the MegaDetector record goes to its own file, the rest to the log / Excel report
+        info = dict(info)
+        record = info.pop("megadetector", None)
+        if record is not None:
+            md_log.append(record)
+        log.append(info)
+
+    def drain_resumed():
+        # files done in an earlier run are not run again; their stored results still go into this report
+        nonlocal done, resumed
+        while not discovery.resumed.empty():
+            _, info = discovery.resumed.get()
+            done += 1
+            resumed += 1
+            if info:
+                report(info)
+
+    try:
+        for path, info in results:
+            if stop_flag and stop_flag.is_set():
+                break  # may be a partial result, leave it for the next run
+            drain_resumed()
+            done += 1
+            if info:
+                report(info)
+            manifest.record(path, info)
+            if progress_cb(done, discovery.total) is False:
+                break
         else:
-            info = process_video(file, output_dir, stop_flag, target_classes, detection_mode)
+            drain_resumed()
+            progress_cb(done, discovery.total)
+    finally:
+        results.close()
+        log.close()
+        md_log.close({"detector": Path(MEGADETECTOR_PATH).name, "detection_completion_time": datetime.now()})
+        manifest.close()
 
-        if info:
-            logs.append(info)
+    if resumed:
+        print(f"[INFO] Resumed: {resumed} files already processed in an earlier run")
 
-        if progress_cb(idx, len(files)) is False:
-            break
+    total_elapsed = (datetime.now() - run_start).total_seconds()
+    print(f"[INFO] Total processing time: {total_elapsed:.2f}s")
 
-    if logs:
-        excel_path = output_dir / f"detections_{datetime.now():%Y%m%d_%H%M%S}.xlsx"
-        pd.DataFrame(logs).to_excel(excel_path, index=False)
-        total_elapsed = (datetime.now() - run_start).total_seconds()
-        print(f"[INFO] Total processing time: {total_elapsed:.2f}s")
+    if log.count:
+        excel_path = output_dir / f"detections_{stamp}.xlsx"
+        logs = excel_from_log(log.path, excel_path)
         return excel_path, logs
 
-    total_elapsed = (datetime.now() - run_start).total_seconds()
-    print(f"[INFO] Total processing time: {total_elapsed:.2f}s")
     return None, []
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import cv2
+
+# ============================================================
+# PERCEPTUAL-HASH DUPLICATE INDEX (shared by every run)
+# - 256-bit dHash of a 17x16 grayscale thumbnail per processed image
+# - survives re-encoding and resizing, so copied / re-uploaded cards
+#   are recognised even when the bytes differ
+# - a hash cannot tell two frames of one burst apart (a small animal
+#   flips no bits), so a copy must also sit in another folder or have
+#   exactly the same file size as the earlier image
+# - a BK-tree answers "hashes within N bits" without scanning every entry
+# - entries point at raw-detection cache keys, so a duplicate takes over
+#   the earlier MegaDetector / SpeciesNet results
+# ============================================================
+INDEX_NAME = "duplicates_v2.sqlite"  # v2: 256-bit hashes + file size
+HASH_SIZE = 16
+
+
+def dhash(image, size=HASH_SIZE) -> int:
+    """difference hash of a BGR image: one bit per horizontally adjacent pixel pair (size x size bits)"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """metric tree over Hamming distance; node = [hash, items, {distance: child}]"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value: int, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int):
+        """[(distance, item)] within max_distance, closest first"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= max_distance:
+                found.extend((d, item) for item in node[1])
+            # triangle inequality: only children at |d - edge| <= max_distance can hold matches
+            for edge, child in node[2].items():
+                if d - max_distance <= edge <= d + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda t: t[0])
+        return found
+
+
+class DuplicateIndex:
+    def __init__(self, cache_dir: Path, max_distance: int, max_time_gap_s: float):
+        """
+        max_distance: dHash bits two copies may differ by
+        max_time_gap_s: capture times of two copies must agree this closely
+        """
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / INDEX_NAME
+        self.max_distance = max_distance
+        self.max_time_gap_s = max_time_gap_s
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            " key TEXT PRIMARY KEY, dhash TEXT NOT NULL, taken REAL,"
+            " width INTEGER, height INTEGER, size INTEGER, path TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+        # whole index in memory: key -> entry, plus the BK-tree over the hashes
+        self._entries = {}
+        self._tree = BKTree()
+        for key, value, taken, width, height, size, path in self._db.execute("SELECT * FROM images"):
+            self._remember(key, int(value, 16), taken, width, height, size, path)
+
+    def _remember(self, key, value, taken, width, height, size, path):
+        entry = {"key": key, "taken": taken, "width": width, "height": height, "size": size, "path": path}
+        self._entries[key] = entry
+        self._tree.add(value, entry)
+
+    def original(self, key: str, path: str):
+        """path of the earlier image stored under this cache key, None if it is `path` itself or unknown"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry["path"] == path:
+            return None
+        return entry["path"]
+
+    def find(self, value: int, taken: float, path: str, size: int):
+        """
+        entries that look like the same photo, closest first
+        path, size: the new image; entries from its own folder only count with the same byte size,
+                    so the next frame of a burst never takes over the results of the previous one
+        """
+        folder = os.path.dirname(path)
+        with self._lock:
+            matches = self._tree.search(value, self.max_distance)
+        return [
+            entry for _, entry in matches
+            if entry["taken"] is not None and abs(entry["taken"] - taken) <= self.max_time_gap_s
+            and (os.path.dirname(entry["path"]) != folder or entry["size"] == size)
+        ]
+
+    def add(self, key: str, value: int, taken: float, width: int, height: int, size: int, path: str):
+        """size: file size in bytes; path: the original image (the first one seen with this content)"""
+        with self._lock:
+            if key in self._entries:
+                return
+            self._remember(key, value, taken, width, height, size, path)
+            self._db.execute(
+                "INSERT OR IGNORE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}", taken, width, height, size, path),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,3 +1,6 @@
+import hashlib
+import os
+import shutil
 from pathlib import Path
 from config import IMAGE_EXT, VIDEO_EXT
 
@@ -9,3 +12,51 @@ def is_video(f: Path):
 
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
+
+def link_or_copy(src: Path, dst: Path):
+    """Hard-link src to dst (same volume, no extra space) or fall back to a copy."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return  # already there (e.g. output folder == input folder); unlinking would delete the original
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def file_sha256(p: Path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def iter_media_files(root: Path, exclude=()):
+    """
+    Recursively yield image/video files under `root` as soon as they are found
+    (os.scandir, folder by folder — nothing waits for the full listing).
+    exclude: folders to skip, e.g. an output folder inside the input folder
+    """
+    skip = {os.path.normcase(os.path.abspath(p)) for p in exclude}
+    stack = [str(root)]
+    while stack:
+        folder = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if os.path.normcase(os.path.abspath(entry.path)) not in skip:
+                                subdirs.append(entry.path)
+                        elif entry.is_file():
+                            f = Path(entry.path)
+                            if is_image(f) or is_video(f):
+                                yield f
+                    except OSError:
+                        continue
+        except OSError:
+            continue  # unreadable folder
+        # depth-first, sub-folders in name order (DCIM/100RECNX, DCIM/101RECNX, ...)
+        stack.extend(sorted(subdirs, reverse=True))
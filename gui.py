@@ -14,8 +14,8 @@ import urllib.error
 from PIL import Image, ImageTk, ImageDraw, ImageFilter
 
 from file_utils import is_image, is_video
-from detector import run_detection
 from config import resource_path
+import model_registry
 
 # Backend server configuration
 BACKEND_URL = "http://164.68.111.61:5050/"
@@ -980,6 +980,9 @@ class YOLOApp:
         self.resend_timer_seconds = 0
         self.resend_timer_active = False
         
+        # Load MegaDetector + SpeciesNet in the background while splash/login are shown
+        model_registry.start_loading()
+        
         # Set window title and icon for branding
         self.root.title("IDOCK Tech Pvt. Ltd.")
         self._set_window_icon()
@@ -2532,7 +2535,8 @@ class YOLOApp:
         if self.stop_flag.is_set():
             return False  # Signal to stop
         
-        percent = (done / total) * 100
+        # total grows while the input folder is still being scanned
+        percent = (done / total) * 100 if total else 0
         self.root.after(0, lambda: self._update_ui_progress(done, total, percent))
         return True  # Continue processing
     
@@ -2584,6 +2588,10 @@ class YOLOApp:
         if not self.input_var.get() or not self.output_var.get():
             messagebox.showerror("Error", "Please select both input and output folders")
             return
+
+        if os.path.abspath(self.input_var.get()) == os.path.abspath(self.output_var.get()):
+            messagebox.showerror("Error", "Output folder must be different from the input folder")
+            return
         
         # Check if either detection mode (human/animal) or specific animals are selected
         mode = self.detection_mode.get()
@@ -2647,6 +2655,14 @@ class YOLOApp:
                 # Use best.pt model with specific animal classes
                 target_classes = list(self.selected_specific_animals)
             
+            # Models normally finish loading during login; wait here if they haven't yet
+            if not model_registry.models_ready.is_set():
+                self.update_status("Loading models...")
+            model_registry.get_models()
+            self.update_status("Processing...")
+            
+            from detector import run_detection
+            
             excel, logs = run_detection(
                 self.input_var.get(),
                 self.output_var.get(),
@@ -8,6 +8,7 @@ if sys.stdout is None:
     sys.stdout = open(os.devnull, "w")
 # ----------------------------------------
 
+import multiprocessing
 import tkinter as tk
 from gui import YOLOApp
 
@@ -30,4 +31,5 @@ def launch():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # detector worker processes in the frozen EXE
     launch()
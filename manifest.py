@@ -0,0 +1,88 @@
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+# ============================================================
+# PROCESSING MANIFEST (SQLite, kept in the output folder)
+# - one row per (file, settings) with size, mtime, model hashes and result
+# - lets an interrupted or repeated run skip files already done
+#   under the same models and settings
+# ============================================================
+MANIFEST_NAME = "processing_manifest.sqlite"
+
+
+class ProcessingManifest:
+    def __init__(self, out_dir: Path, settings: dict):
+        """
+        settings: everything that changes the result of a file
+                  (model hashes, target classes, thresholds, ...)
+        """
+        self.path = Path(out_dir) / MANIFEST_NAME
+        self.settings = json.dumps(settings, sort_keys=True, default=str)
+        self.md_hash = settings.get("md_hash")
+        self.species_hash = settings.get("species_hash")
+
+        self._db = sqlite3.connect(str(self.path))
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                settings TEXT NOT NULL,
+                md_hash TEXT,
+                species_hash TEXT,
+                result TEXT,
+                processed_at TEXT,
+                PRIMARY KEY (path, settings)
+            )
+            """
+        )
+        self._db.commit()
+
+        # everything already done under these settings, keyed by path
+        self._done = {
+            path: (size, mtime, result)
+            for path, size, mtime, result in self._db.execute(
+                "SELECT path, size, mtime, result FROM files WHERE settings = ?",
+                (self.settings,),
+            )
+        }
+
+    @staticmethod
+    def _stat(path: Path):
+        st = path.stat()
+        return st.st_size, st.st_mtime
+
+    def lookup(self, path: Path):
+        """Return (done, info) — info is the stored result dict (None if the file had no match)."""
+        row = self._done.get(str(path))
+        if row is None:
+            return False, None
+        size, mtime, result = row
+        if (size, mtime) != self._stat(path):
+            return False, None  # file changed since it was processed
+        return True, (json.loads(result) if result else None)
+
+    def record(self, path: Path, info):
+        size, mtime = self._stat(path)
+        result = json.dumps(info, default=str) if info else None
+        self._db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(path), size, mtime, self.settings, self.md_hash, self.species_hash,
+             result, datetime.now().isoformat(timespec="seconds")),
+        )
+        self._db.commit()
+        self._done[str(path)] = (size, mtime, result)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
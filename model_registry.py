@@ -0,0 +1,46 @@
+import threading
+
+# ============================================================
+# LAZY MODEL REGISTRY
+# - MegaDetector + SpeciesNet are loaded once, on a background thread,
+#   and every later run gets the same instances
+# - `models_ready` is set once loading has finished (or failed)
+# - import-light on purpose (no torch) so the GUI can start loading
+#   during splash/login without waiting for it
+# ============================================================
+models_ready = threading.Event()
+
+_lock = threading.Lock()
+_thread = None
+_models = None
+_error = None
+
+
+def _load():
+    global _models, _error
+    try:
+        import detector  # applies the YOLOv5 / torch.hub guards before torch is used
+        _models = detector.load_models()
+    except BaseException as e:
+        _error = e
+    finally:
+        models_ready.set()
+
+
+def start_loading():
+    """Start loading the models in the background (no-op if already started)."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_load, name="model-loader", daemon=True)
+            _thread.start()
+
+
+def get_models(timeout=None):
+    """Wait for the models and return (md_model, classifier)."""
+    start_loading()
+    if not models_ready.wait(timeout):
+        raise TimeoutError("Models are still loading")
+    if _error is not None:
+        raise RuntimeError(f"Model loading failed: {_error}") from _error
+    return _models
@@ -0,0 +1,144 @@
+import queue
+import threading
+
+# ============================================================
+# STAGED PIPELINE
+# - each stage runs on its own worker threads
+# - stages are connected by bounded queues (back-pressure keeps memory flat);
+#   each stage can bound its own input queue, so stages whose items hold
+#   large frames get short queues
+# - `stop_flag` (threading.Event) shuts every stage down cleanly
+# ============================================================
+
+_END = object()  # end-of-stream marker passed from stage to stage
+_POLL_S = 0.1    # how often blocked workers re-check the stop flag
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, batch_size=1, queue_size=None):
+        """
+        fn: called with one item (batch_size == 1) or a list of items (batch_size > 1)
+            and returns the item / list of items to hand to the next stage
+        queue_size: max items waiting in front of this stage (None = the pipeline's queue_size)
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.queue_size = queue_size
+
+
+class Pipeline:
+    def __init__(self, stages, stop_flag=None, queue_size=32):
+        self.stages = list(stages)
+        self.stop_flag = stop_flag
+        self.queue_size = queue_size
+        self._abort = threading.Event()
+        self._error = None
+
+    def _stopped(self):
+        return self._abort.is_set() or (self.stop_flag is not None and self.stop_flag.is_set())
+
+    def _put(self, q, item):
+        while not self._stopped():
+            try:
+                q.put(item, timeout=_POLL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stopped():
+            try:
+                return q.get(timeout=_POLL_S)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _feed(self, items, out_q):
+        try:
+            for item in items:
+                if not self._put(out_q, item):
+                    return
+            self._put(out_q, _END)
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._abort.set()
+
+    def _work(self, stage, in_q, out_q, remaining, lock):
+        try:
+            finished = False
+            while not finished and not self._stopped():
+                item = self._get(in_q)
+                if item is _END:
+                    break
+
+                if stage.batch_size == 1:
+                    results = [stage.fn(item)]
+                else:
+                    batch = [item]
+                    while len(batch) < stage.batch_size:
+                        try:
+                            nxt = in_q.get_nowait()
+                        except queue.Empty:
+                            break
+                        if nxt is _END:
+                            finished = True
+                            break
+                        batch.append(nxt)
+                    results = stage.fn(batch)
+
+                for result in results:
+                    if not self._put(out_q, result):
+                        return
+
+            # let sibling workers see the end marker too
+            self._put(in_q, _END)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._put(out_q, _END)
+
+    def run(self, items):
+        """Feed `items` through every stage and yield results as they leave the last one."""
+        sizes = [stage.queue_size or self.queue_size for stage in self.stages] + [self.queue_size]
+        queues = [queue.Queue(maxsize=size) for size in sizes]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+
+        for i, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], queues[i + 1], remaining, lock),
+                    name=f"pipeline-{stage.name}",
+                    daemon=True,
+                ))
+
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _END:
+                    break
+                yield item
+        finally:
+            # consumer stopped early or finished: release any blocked workers
+            self._abort.set()
+            for t in threads:
+                t.join()
+
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,202 @@
+"""
+Build the INT8 OpenVINO MegaDetector used by MD_BACKEND = "openvino".
+
+    python quantize_openvino.py --calibration D:\\traps\\calibration --labelled D:\\traps\\labelled
+
+1. exports best.pt to ONNX (the same cached file the "onnx" backend uses)
+2. converts it to OpenVINO IR and quantizes it to INT8 with NNCF,
+   calibrated on a sample of our own camera-trap images
+3. with --labelled: compares INT8 against the FP32 model on a labelled sample
+   (YOLO .txt next to each image: "class cx cy w h", normalised,
+   MegaDetector classes 0 animal, 1 person, 2 vehicle; no .txt = blank)
+   and writes accuracy_report.json next to the IR
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import detector
+from backends import ensure_export, find_artifact
+from config import CACHE_DIR, MD_INPUT_SIZE
+from file_utils import is_image, iter_media_files
+
+MD_CLASSES = {0: "animal", 1: "person", 2: "vehicle"}
+
+
+# ============================================================
+# CALIBRATION + QUANTIZATION
+# ============================================================
+def _readable(path: Path) -> bool:
+    try:
+        with Image.open(path):
+            return True
+    except OSError:
+        return False
+
+
+def calibration_sample(folder, count):
+    """up to `count` images spread evenly over the sorted folder tree (every camera, day and night)"""
+    paths = sorted(p for p in iter_media_files(Path(folder)) if is_image(p))
+    if len(paths) > count:
+        step = len(paths) / count
+        paths = [paths[int(i * step)] for i in range(count)]
+    return [p for p in paths if _readable(p)]
+
+
+def quantize(onnx_path: Path, out_dir: Path, images, md_model, preset="mixed"):
+    """FP32 ONNX -> INT8 OpenVINO IR in out_dir; inputs are built exactly like detector inputs"""
+    import nncf
+    import openvino as ov
+    from yolov5.utils.general import yaml_save
+
+    print(f"[INFO] Quantizing {onnx_path.name} on {len(images)} calibration images")
+    ov_model = ov.convert_model(str(onnx_path))
+    dataset = nncf.Dataset(images, detector.detector_input)
+    quantized = nncf.quantize(
+        ov_model,
+        dataset,
+        preset=nncf.QuantizationPreset.MIXED if preset == "mixed" else nncf.QuantizationPreset.PERFORMANCE,
+        subset_size=len(images),
+    )
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    xml = out_dir / f"{onnx_path.stem}.xml"
+    ov.save_model(quantized, str(xml), compress_to_fp16=False)
+    # DetectMultiBackend reads stride / names from <name>.yaml next to the .xml
+    yaml_save(xml.with_suffix(".yaml"), {"stride": int(max(md_model.stride)), "names": md_model.names})
+    return out_dir
+
+
+# ============================================================
+# ACCURACY DELTA (INT8 vs FP32)
+# ============================================================
+def read_labels(image_path: Path):
+    """YOLO .txt next to the image -> (N, 5) [cls, x1, y1, x2, y2], normalised"""
+    rows = []
+    txt = image_path.with_suffix(".txt")
+    if txt.is_file():
+        for line in txt.read_text().splitlines():
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cls, cx, cy, w, h = int(float(parts[0])), *map(float, parts[1:5])
+            rows.append([cls, cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+
+def match_counts(det, gt, iou_threshold):
+    """{class: [tp, fp, fn]} for one image; detections matched greedily, most confident first"""
+    counts = {}
+    for cls in MD_CLASSES:
+        d = det[det[:, 5] == cls]
+        d = d[np.argsort(-d[:, 4])]
+        g = gt[gt[:, 0] == cls][:, 1:]
+        iou = detector._iou_matrix(d[:, :4], g)
+        used = np.zeros(len(g), dtype=bool)
+        tp = 0
+        for i in range(len(d)):
+            free = np.where(~used & (iou[i] >= iou_threshold))[0]
+            if len(free):
+                used[free[np.argmax(iou[i, free])]] = True
+                tp += 1
+        counts[cls] = [tp, len(d) - tp, len(g) - tp]
+    return counts
+
+
+def evaluate(md_model, images, iou_threshold):
+    """per-class precision / recall / F1, plus the classes present in each image"""
+    totals = {cls: [0, 0, 0] for cls in MD_CLASSES}
+    present = []
+    for path in images:
+        det = detector.detect_file(path, md_model)
+        if det is None:
+            det = np.zeros((0, 6), dtype=np.float32)
+        for cls, (tp, fp, fn) in match_counts(det, read_labels(path), iou_threshold).items():
+            totals[cls][0] += tp
+            totals[cls][1] += fp
+            totals[cls][2] += fn
+        present.append(sorted({int(c) for c in det[:, 5]}))
+
+    metrics = {}
+    for cls, (tp, fp, fn) in totals.items():
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        metrics[MD_CLASSES[cls]] = {"tp": tp, "fp": fp, "fn": fn, "precision": precision, "recall": recall, "f1": f1}
+    return metrics, present
+
+
+def accuracy_report(fp32_model, int8_model, images, iou_threshold):
+    fp32, fp32_present = evaluate(fp32_model, images, iou_threshold)
+    int8, int8_present = evaluate(int8_model, images, iou_threshold)
+    return {
+        "images": len(images),
+        "iou_threshold": iou_threshold,
+        "conf_threshold": fp32_model.conf,
+        "fp32": fp32,
+        "int8": int8,
+        "delta": {
+            name: {k: int8[name][k] - fp32[name][k] for k in ("precision", "recall", "f1")}
+            for name in fp32
+        },
+        # images where both models report the same classes (what decides saved vs blank)
+        "image_agreement": float(np.mean([a == b for a, b in zip(fp32_present, int8_present)])) if images else 1.0,
+    }
+
+
+def print_report(report):
+    print(f"\n[INFO] INT8 vs FP32 on {report['images']} labelled images "
+          f"(IoU >= {report['iou_threshold']}, conf >= {report['conf_threshold']})")
+    print(f"{'class':<8} {'P fp32':>7} {'P int8':>7} {'R fp32':>7} {'R int8':>7} {'dF1':>7}")
+    for name in report["fp32"]:
+        a, b = report["fp32"][name], report["int8"][name]
+        print(f"{name:<8} {a['precision']:7.3f} {b['precision']:7.3f} {a['recall']:7.3f} {b['recall']:7.3f} "
+              f"{report['delta'][name]['f1']:+7.3f}")
+    print(f"image-level agreement: {report['image_agreement']:.3f}")
+
+
+# ============================================================
+# MAIN
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Quantize MegaDetector to INT8 OpenVINO IR on our own trap images.")
+    parser.add_argument("--calibration", required=True, help="folder of camera-trap images (searched recursively)")
+    parser.add_argument("--count", type=int, default=300, help="calibration images to sample")
+    parser.add_argument("--labelled", help="folder of images with YOLO .txt labels for the accuracy report")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for a detection to match a label")
+    parser.add_argument("--preset", choices=("mixed", "performance"), default="mixed", help="NNCF quantization preset")
+    parser.add_argument("--force", action="store_true", help="rebuild even if an INT8 model exists")
+    args = parser.parse_args()
+
+    weights = Path(detector.MEGADETECTOR_PATH)
+    weights_hash = detector.model_hashes()["md_hash"]
+    fp32_model = detector.load_megadetector("pytorch")
+
+    out_dir, exists = find_artifact(weights, weights_hash, "openvino", CACHE_DIR)
+    if exists and not args.force:
+        print(f"[INFO] Using existing INT8 model: {out_dir}")
+    else:
+        images = calibration_sample(args.calibration, args.count)
+        if not images:
+            raise SystemExit(f"no readable images in {args.calibration}")
+        onnx_path = ensure_export(
+            "onnx", weights, weights_hash, lambda: detector.load_megadetector("pytorch").model, CACHE_DIR, MD_INPUT_SIZE
+        )
+        quantize(onnx_path, out_dir, images, fp32_model, args.preset)
+        print(f"[INFO] INT8 model saved: {out_dir}")
+
+    if args.labelled:
+        images = sorted(p for p in iter_media_files(Path(args.labelled)) if is_image(p))
+        report = accuracy_report(fp32_model, detector.load_megadetector("openvino"), images, args.iou)
+        print_report(report)
+        with open(out_dir / "accuracy_report.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    print('[INFO] Set MD_BACKEND = "openvino" in config.py to use it')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+
+# ============================================================
+# STREAMING RESULT LOG
+# - one JSON line per saved file, flushed as soon as the file is done
+#   so a crash loses at most the file in flight
+# - the Excel report is built from the log at the end of the run
+# ============================================================
+
+
+class ResultLog:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.count = 0
+        self._f = None
+
+    def append(self, info: dict):
+        if self._f is None:
+            # opened lazily so runs without detections leave no empty log behind
+            self._f = open(self.path, "a", encoding="utf-8")
+        self._f.write(json.dumps(info, default=str) + "\n")
+        self._f.flush()
+        self.count += 1
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ============================================================
+# MEGADETECTOR BATCH OUTPUT
+# - one JSON per run in MegaDetector's batch-output format (format 1.4),
+#   which Timelapse and other MegaDetector tools import
+# - file paths are relative to the output folder; detection categories
+#   are MegaDetector's string ids, species go in as classifications
+# - images are streamed into the "images" list as they are saved, the
+#   category maps are written when the run ends
+# ============================================================
+MD_DETECTION_CATEGORIES = {"1": "animal", "2": "person", "3": "vehicle"}
+
+
+class MegaDetectorLog:
+    def __init__(self, path: Path, root: Path):
+        self.path = Path(path)
+        self.root = Path(root)
+        self.count = 0
+        self.species = {}  # species name -> classification category id
+        self._f = None
+
+    def append(self, record: dict):
+        """record: {"file": saved path, "detections": [{"category", "conf", "bbox", "species", "species_conf"}]}"""
+        if self._f is None:
+            self._f = open(self.path, "w", encoding="utf-8")
+            self._f.write('{"images": [\n')
+        path = Path(record["file"])
+        try:
+            path = path.relative_to(self.root)
+        except ValueError:
+            pass  # outside the output folder: keep it absolute
+        detections = []
+        for det in record["detections"]:
+            det = dict(det)
+            species, species_conf = det.pop("species", None), det.pop("species_conf", None)
+            if species:
+                category = self.species.setdefault(species, str(len(self.species) + 1))
+                det["classifications"] = [[category, species_conf]]
+            detections.append(det)
+        image = {"file": path.as_posix(), "detections": detections}
+        self._f.write(("" if self.count == 0 else ",\n") + json.dumps(image))
+        self._f.flush()
+        self.count += 1
+
+    def close(self, info=None):
+        if self._f is None:
+            return
+        self._f.write("\n],\n")
+        self._f.write(f' "detection_categories": {json.dumps(MD_DETECTION_CATEGORIES)},\n')
+        self._f.write(f' "classification_categories": {json.dumps({v: k for k, v in self.species.items()})},\n')
+        self._f.write(f' "info": {json.dumps({"format_version": "1.4", **(info or {})}, default=str)}\n}}\n')
+        self._f.close()
+        self._f = None
+
+
+def read_log(path: Path):
+    """Yield the result dicts of a log, skipping a half-written last line."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def excel_from_log(log_path: Path, excel_path: Path):
+    """Write the Excel report for a log (also works on the log of a crashed run)."""
+    df = pd.DataFrame(list(read_log(log_path)))
+    df.to_excel(excel_path, index=False)
+    return df.to_dict("records")
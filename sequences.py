@@ -0,0 +1,65 @@
+import os
+from datetime import datetime
+
+from PIL import Image
+
+# ============================================================
+# BURST / SEQUENCE GROUPING
+# - camera traps shoot several frames per trigger
+# - images of one folder taken at most `max_gap_s` apart form one sequence
+# - capture time: EXIF DateTimeOriginal, then EXIF DateTime, then file mtime
+# ============================================================
+_EXIF_IFD = 0x8769
+_DATETIME_ORIGINAL = 36867
+_DATETIME = 306
+
+
+def capture_time(path) -> float:
+    """seconds since the epoch (only the file header is read)"""
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif()
+            value = exif.get_ifd(_EXIF_IFD).get(_DATETIME_ORIGINAL) or exif.get(_DATETIME)
+        if value:
+            return datetime.strptime(str(value).strip("\x00 ")[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+    except (OSError, ValueError, SyntaxError):
+        pass  # unreadable header or a camera that writes garbage dates
+    return os.path.getmtime(path)
+
+
+def split_sequences(items, max_gap_s, max_images):
+    """
+    items: [(path, out_dir)] from one folder
+    returns a list of sequences, each a list of (path, out_dir) in capture order
+    """
+    timed = sorted(((capture_time(p), p.name, p, o) for p, o in items), key=lambda t: t[:2])
+
+    sequences = []
+    last_t = None
+    for t, _, path, out_dir in timed:
+        if (
+            not sequences
+            or t - last_t > max_gap_s
+            or len(sequences[-1]) >= max_images  # time-lapse / busy trap: keep sequences bounded
+        ):
+            sequences.append([])
+        sequences[-1].append((path, out_dir))
+        last_t = t
+    return sequences
+
+
+def iter_sequences(items, max_gap_s, max_images):
+    """
+    items: stream of (path, out_dir) where each folder's files arrive back to back
+    (as iter_media_files yields them); a folder is split once its last file is seen
+    """
+    folder = None
+    pending = []
+    for path, out_dir in items:
+        if path.parent != folder and pending:
+            yield from split_sequences(pending, max_gap_s, max_images)
+            pending = []
+        folder = path.parent
+        pending.append((path, out_dir))
+    if pending:
+        yield from split_sequences(pending, max_gap_s, max_images)
@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")  # detector imports torch / yolov5 at module level
+
+from detector import BackgroundFilter
+
+
+def _scene(seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(noise, (1600, 1200)), (0, 0), 3)
+
+
+def _frames(scene, count, animal=False):
+    for _ in range(count):
+        frame = scene.copy()
+        if animal:
+            cv2.rectangle(frame, (600, 500), (1000, 740), (30, 30, 30), -1)  # ~5% of the frame
+        yield frame
+
+
+def _run(bg, frames, megadetector_blank):
+    """'R' = rejected by the filter, 'm' = sent to MegaDetector"""
+    out = ""
+    for frame in frames:
+        blank, sample = bg.is_blank("cam", frame)
+        if blank:
+            out += "R"
+            continue
+        if megadetector_blank:
+            bg.confirm_blank(sample)
+        out += "m"
+    return out
+
+
+def test_resting_animal_never_becomes_background():
+    bg = BackgroundFilter()
+    scene = _scene()
+    assert _run(bg, _frames(scene, 6), True) == "mmmRRR"
+    assert _run(bg, _frames(scene, 10, animal=True), False) == "m" * 10
+    assert _run(bg, _frames(scene, 2), True) == "RR"
+
+
+def test_scene_change_rebuilds_the_background():
+    bg = BackgroundFilter(reset_frames=3)
+    _run(bg, _frames(_scene(0), 6), True)
+    assert _run(bg, _frames(_scene(1), 5), True) == "mmmRR"
@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+
+from duplicate_index import BKTree, DuplicateIndex, dhash, hamming
+
+
+def _background():
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(noise, (1600, 1200)), (0, 0), 3)
+
+
+def _with_animal(image, x, y, size):
+    frame = image.copy()
+    cv2.ellipse(frame, (x + size // 2, y + size // 2), (size // 2, size // 3), 0, 0, 360, (40, 60, 70), -1)
+    return frame
+
+
+def _reencoded(image):
+    small = cv2.resize(image, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    return cv2.imdecode(cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, 70])[1], cv2.IMREAD_COLOR)
+
+
+def test_burst_frames_are_not_merged(tmp_path):
+    # two frames of one trigger: same folder, same EXIF second, an animal walks into the second
+    blank = _background()
+    animal = _with_animal(blank, 600, 500, 100)
+    index = DuplicateIndex(tmp_path, max_distance=3, max_time_gap_s=1.0)
+
+    index.add("k1", dhash(blank), 1000.0, 1600, 1200, 812345, "card/100RECNX/IMG_0001.JPG")
+    assert hamming(dhash(blank), dhash(animal)) <= 3  # the hash alone cannot tell them apart
+    assert index.find(dhash(animal), 1000.0, "card/100RECNX/IMG_0002.JPG", 815020) == []
+    index.close()
+
+
+def test_copy_in_another_folder_is_found(tmp_path):
+    frame = _with_animal(_background(), 600, 500, 300)
+    index = DuplicateIndex(tmp_path, max_distance=3, max_time_gap_s=1.0)
+
+    index.add("k1", dhash(frame), 1000.0, 1600, 1200, 812345, "card/100RECNX/IMG_0001.JPG")
+    found = index.find(dhash(_reencoded(frame)), 1000.0, "backup/100RECNX/IMG_0001.JPG", 201877)
+    assert [entry["key"] for entry in found] == ["k1"]
+    index.close()
+
+
+def test_index_survives_reopening(tmp_path):
+    frame = _background()
+    index = DuplicateIndex(tmp_path, max_distance=3, max_time_gap_s=1.0)
+    index.add("k1", dhash(frame), 1000.0, 1600, 1200, 812345, "card/IMG_0001.JPG")
+    index.close()
+
+    index = DuplicateIndex(tmp_path, max_distance=3, max_time_gap_s=1.0)
+    assert [entry["key"] for entry in index.find(dhash(frame), 1000.5, "backup/IMG_0001.JPG", 812345)] == ["k1"]
+    index.close()
+
+
+def test_bktree_matches_brute_force():
+    rng = np.random.default_rng(1)
+    values = [int(rng.integers(0, 1 << 62)) for _ in range(300)]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+    query = values[0] ^ 0b1011
+    expected = sorted(i for i, value in enumerate(values) if hamming(query, value) <= 6)
+    assert sorted(item for _, item in tree.search(query, 6)) == expected
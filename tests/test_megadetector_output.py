@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+def _bboxes_in_range(record):
+    return all(0.0 <= v <= 1.0 for det in record["detections"] for v in det["bbox"]) and all(
+        det["bbox"][0] + det["bbox"][2] <= 1.0 and det["bbox"][1] + det["bbox"][3] <= 1.0 for det in record["detections"]
+    )
+
+
+def test_preview_boxes_are_normalised_to_full_resolution(monkeypatch):
+    pytest.importorskip("torch")  # detector imports torch / yolov5 at module level
+    import detector
+
+    monkeypatch.setattr(detector, "IMAGE_OUTPUT_MODE", "preview")
+    monkeypatch.setattr(detector, "IMAGE_PREVIEW_WIDTH", 640)
+
+    # 4000 x 3000 JPEG decoded at 1/4
+    job = detector.ImageJob(Path("in/a.jpg"), Path("out"))
+    job.image = np.zeros((750, 1000, 3), dtype=np.uint8)
+    job.scale = 4
+    job.detections = np.array([[2000, 1500, 3000, 2600, 0.9, 0], [3500, 2800, 4100, 3100, 0.8, 0]], dtype=np.float32)
+    job.boxes = [(2000, 1500, 3000, 2600, 0.9, 0), (3500, 2800, 4100, 3100, 0.8, 1)]
+    job.species = [("Deer", 0.8), ("Deer", 0.7)]
+
+    detector._annotate_job(job)
+
+    record = job.info["megadetector"]
+    assert job.image.shape[1] == 640
+    assert record["detections"][0]["bbox"] == [0.5, 0.5, 0.25, 0.3667]
+    assert _bboxes_in_range(record)
+
+
+def test_megadetector_log_is_batch_output(tmp_path):
+    pytest.importorskip("pandas")
+    from result_log import MegaDetectorLog
+
+    log = MegaDetectorLog(tmp_path / "megadetector.json", tmp_path)
+    log.append({
+        "file": str(tmp_path / "cam1" / "a.jpg"),
+        "detections": [{"category": "1", "conf": 0.9, "bbox": [0.5, 0.5, 0.25, 0.3667], "species": "Deer", "species_conf": 0.8}],
+    })
+    log.close({"detector": "best.pt"})
+
+    output = json.loads((tmp_path / "megadetector.json").read_text(encoding="utf-8"))
+    assert output["images"][0]["file"] == "cam1/a.jpg"
+    assert output["images"][0]["detections"][0]["classifications"] == [["1", 0.8]]
+    assert output["detection_categories"]["1"] == "animal"
+    assert output["classification_categories"] == {"1": "Deer"}
+    assert all(_bboxes_in_range(image) for image in output["images"])
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("torch")  # detector imports torch / yolov5 at module level
+
+from detector import SimpleTracker
+
+
+def _track_count(size, speed, interval, frames=150):
+    tracker = SimpleTracker()
+    ids = set()
+    for frame_idx in range(0, frames, interval):
+        x = 100 + speed * frame_idx
+        ids.update(tid for tid, _, _ in tracker.update([[x, 100, x + size, 100 + size]], frame_idx))
+    return len(ids)
+
+
+@pytest.mark.parametrize("size,speed", [(50, 3), (40, 6), (60, 8), (20, 6), (100, 20)])
+@pytest.mark.parametrize("interval", [1, 5, 10])
+def test_small_fast_box_keeps_one_track(size, speed, interval):
+    assert _track_count(size, speed, interval) == 1
+
+
+def test_parallel_animals_keep_their_tracks():
+    tracker = SimpleTracker()
+    for frame_idx in range(0, 100, 10):
+        x = 100 + 5 * frame_idx
+        assigned = tracker.update([[x, 100, x + 40, 140], [x, 200, x + 40, 240]], frame_idx)
+        assert sorted((tid, box[1]) for tid, box, _ in assigned) == [(1, 100), (2, 200)]
+